@@ -1,36 +1,2169 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
+import re
+import math
+import asyncio
+import json
+import random
+import inspect
+import functools
+import itertools
+import contextvars
+import hashlib
 import logging
-from typing import List, Dict, Optional
+import tempfile
+import email.utils
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter, OrderedDict, deque
+from typing import List, Dict, Optional, Iterator, AsyncIterator, Tuple, Callable, Literal
 from dotenv import load_dotenv
-from openai import OpenAI
-from pypdf import PdfReader
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+import pypdf
 import gradio as gr
-from pydantic import BaseModel
+import httpx
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+from pdf_extraction import extract_pages
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv(override=True)
+
+STREAM_REJECTION_POLICIES = ("replace", "keep")
+
+EVALUATION_UNAVAILABLE = "Evaluation service unavailable"
+# Tokens reserved for the fixed wording wrapped around the evaluated exchange
+EVALUATION_PROMPT_OVERHEAD_TOKENS = 100
+EVALUATION_SKIPPED = "Evaluation skipped by policy"
+
+# always: evaluate every reply; sampled: evaluate a random fraction;
+# precheck: only escalate replies that fail cheap local checks
+EVALUATION_POLICIES = ("always", "sampled", "precheck")
+
+# Cheap local signals that a reply needs the full evaluator
+PRECHECK_MIN_CHARS = 20
+PRECHECK_MAX_CHARS = 4000
+_REFUSAL_PATTERNS = re.compile(
+    r"\bI (?:can(?:not|'t)|am unable to|won't) (?:help|answer|assist|provide|share)|\bI'm sorry, but\b",
+    re.IGNORECASE,
+)
+_OUT_OF_CHARACTER_PATTERNS = re.compile(
+    r"\bas an ai\b|\blanguage model\b|\bI am an AI\b|\bI'm an AI\b|<think>|</think>|\bsystem prompt\b",
+    re.IGNORECASE,
+)
+
+class StageSettings(BaseModel):
+    """Endpoint, model and transport settings for one upstream stage"""
+    model_config = ConfigDict(extra="forbid")
+    
+    base_url: str
+    model: str
+    max_tokens: Optional[int] = Field(default=None, gt=0)
+    temperature: Optional[float] = Field(default=None, ge=0.0, le=2.0)
+    connect_timeout: float = Field(default=5.0, gt=0)
+    read_timeout: float = Field(default=60.0, gt=0)
+    # Retries of transient failures (timeouts, connection errors, 408/409/429/5xx); the SDK's own retries are off
+    max_retries: int = Field(default=2, ge=0)
+    # Full-jitter exponential backoff: retry n sleeps uniform(0, min(retry_max_delay, retry_base_delay * 2**n))
+    retry_base_delay: float = Field(default=0.5, gt=0)
+    retry_max_delay: float = Field(default=8.0, gt=0)
+    # Optional calls to this stage (evaluation, regeneration) are skipped when less of the request budget is left
+    min_budget_seconds: float = Field(default=5.0, ge=0)
+    # Calls slower than this (to the first token when streaming) count against the circuit breaker
+    slow_call_seconds: float = Field(default=30.0, gt=0)
+    # Estimated prompt tokens (system prompt, history and new input); older history is trimmed to fit
+    prompt_token_budget: int = Field(default=8000, gt=0)
+    # Simultaneous calls to this endpoint (0 is unlimited); a streamed call holds its slot until the stream is drained or closed
+    max_concurrency: int = Field(default=16, ge=0)
+    # Provider request quota (0 is unlimited) and how many calls may go out back to back
+    requests_per_minute: float = Field(default=0.0, ge=0.0)
+    burst: int = Field(default=5, ge=1)
+    
+    @field_validator("base_url")
+    @classmethod
+    def _check_base_url(cls, value: str) -> str:
+        if not value.startswith(("http://", "https://")):
+            raise ValueError(f"base_url must be an http(s) URL, got '{value}'")
+        return value
+    
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+    
+    def completion_options(self) -> Dict:
+        """Model parameters to pass to chat.completions, omitting unset ones"""
+        options = {"model": self.model, "max_tokens": self.max_tokens, "temperature": self.temperature}
+        return {key: value for key, value in options.items() if value is not None}
+
+class Settings(BaseModel):
+    """Typed runtime configuration, loaded once at startup from a JSON file and the environment
+    
+    Precedence is defaults < CHATBOT_CONFIG file < environment. Top-level fields are read
+    from the upper-cased field name (e.g. RESPONSE_CACHE_TTL); stage fields from
+    GENERATOR_<FIELD> and EVALUATOR_<FIELD> (e.g. EVALUATOR_READ_TIMEOUT).
+    """
+    model_config = ConfigDict(extra="forbid")
+    
+    generation: StageSettings = StageSettings(
+        base_url="https://openrouter.ai/api/v1",
+        model="tngtech/deepseek-r1t2-chimera:free",
+        max_tokens=1000,
+        temperature=0.7,
+        min_budget_seconds=15.0,
+    )
+    evaluation: StageSettings = StageSettings(
+        base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+        model="gemini-2.5-flash",
+        read_timeout=30.0,
+        slow_call_seconds=15.0,
+        prompt_token_budget=6000,
+    )
+    
+    linkedin_pdf_path: str = "me/linkedin.pdf"
+    summary_path: str = "me/summary.txt"
+    
+    stream_responses: bool = True
+    stream_rejection_policy: Literal["replace", "keep"] = "replace"
+    async_handlers: bool = False
+    # Threads reviewing already-delivered replies when evaluation runs in the background
+    background_evaluation: bool = False
+    background_evaluation_workers: int = Field(default=8, gt=0)
+    
+    evaluation_policy: Literal["always", "sampled", "precheck"] = "always"
+    evaluation_sample_rate: float = Field(default=0.25, ge=0.0, le=1.0)
+    evaluation_skip_on_cache_hit: bool = True
+    
+    # Vetted replies to repeated questions are served from memory
+    response_cache_size: int = Field(default=256, ge=0)
+    response_cache_ttl: float = Field(default=3600.0, gt=0)
+    
+    # Secondary generation route raced against a stalled primary (HEDGE_* variables; inherits generation)
+    hedge_generation: Optional[StageSettings] = None
+    # Hedge once the primary is slower than this percentile of its recent first-token latencies
+    hedge_percentile: float = Field(default=0.95, gt=0.0, lt=1.0)
+    # Used until enough primary latencies have been observed
+    hedge_initial_delay: float = Field(default=3.0, gt=0)
+    hedge_min_delay: float = Field(default=0.5, gt=0)
+    hedge_max_delay: float = Field(default=15.0, gt=0)
+    
+    # Per-endpoint circuit breakers trip when this share of recent calls failed or were slow
+    circuit_failure_rate: float = Field(default=0.5, gt=0.0, le=1.0)
+    circuit_window: int = Field(default=20, gt=0)
+    circuit_min_calls: int = Field(default=5, gt=0)
+    # How long a tripped endpoint is skipped before a single probe call is let through
+    circuit_open_seconds: float = Field(default=30.0, gt=0)
+    
+    # Sessions longer than this many messages have their older turns folded into a running summary (0 disables)
+    history_summary_threshold: int = Field(default=16, ge=0)
+    # Most recent messages always sent verbatim alongside the summary
+    history_summary_keep_recent: int = Field(default=6, ge=0)
+    history_summary_max_tokens: int = Field(default=400, gt=0)
+    
+    # Precomputed, evaluator-approved answers to common questions (see build_answer_bank.py)
+    answer_bank_path: str = "me/answer_bank.json"
+    faq_questions_path: str = "me/faq.txt"
+    # Jaccard similarity of content-word shingles a first-turn question needs to be served from the bank
+    answer_bank_min_similarity: float = Field(default=0.75, gt=0.0, le=1.0)
+    
+    # Reuse vetted first-turn replies for reworded questions (0 disables)
+    near_duplicate_cache_size: int = Field(default=256, ge=0)
+    # Jaccard similarity of the content words' character trigrams needed for a near-duplicate hit,
+    # set against the labelled pairs in tests/test_question_matching.py
+    near_duplicate_threshold: float = Field(default=0.7, gt=0.0, le=1.0)
+    # Fraction of near-duplicate hits re-checked by the evaluator in the background
+    near_duplicate_audit_rate: float = Field(default=0.1, ge=0.0, le=1.0)
+    
+    # End-to-end time budget of one visitor request, shared by generation, evaluation and regeneration
+    request_deadline_seconds: float = Field(default=60.0, gt=0.0)
+    
+    # Calls waiting for an upstream slot or rate token, per upstream, before new ones are turned away
+    admission_queue_size: int = Field(default=64, ge=0)
+    # Longest a call may wait for admission before the visitor gets a "busy" reply
+    admission_max_wait: float = Field(default=10.0, gt=0.0)
+    
+    # Concurrent identical questions share one generate/evaluate round trip
+    coalesce_requests: bool = True
+    
+    # Poll the profile sources this often (seconds) and hot-reload them when they change (0 disables)
+    profile_reload_interval: float = Field(default=5.0, ge=0)
+    
+    # Serve Prometheus metrics on this port (disabled when unset)
+    metrics_port: Optional[int] = Field(default=None, gt=0, lt=65536)
+    
+    # Extracted PDF text is cached here, next to me/, so restarts and extra workers skip pypdf
+    profile_cache_dir: str = ".profile_cache"
+    # Passed to PageObject.extract_text; part of the cache key
+    pdf_extraction_mode: Literal["plain", "layout"] = "plain"
+    # Fan page extraction out across processes for long PDFs; below the page threshold it stays serial.
+    # A text page takes ~12ms and starting a worker (interpreter + pypdf) ~0.22s, so 2 workers only pay off from ~40 pages on 2+ cores
+    pdf_extraction_workers: int = Field(default=1, gt=0)
+    pdf_parallel_min_pages: int = Field(default=48, gt=0)
+    
+    # Profiles longer than this are chunked and only the most relevant chunks go into each prompt
+    retrieval_min_profile_chars: int = Field(default=12000, ge=0)
+    retrieval_top_k: int = Field(default=6, gt=0)
+    retrieval_chunk_chars: int = Field(default=800, gt=0)
+    
+    @model_validator(mode="after")
+    def _check_hedge_delays(self) -> "Settings":
+        if self.hedge_min_delay > self.hedge_max_delay:
+            raise ValueError("hedge_min_delay must not exceed hedge_max_delay")
+        return self
+    
+    @model_validator(mode="after")
+    def _check_history_summary(self) -> "Settings":
+        if self.history_summary_threshold and self.history_summary_keep_recent >= self.history_summary_threshold:
+            raise ValueError("history_summary_keep_recent must be below history_summary_threshold")
+        return self
+    
+    @property
+    def pdf_extraction_options(self) -> Dict:
+        return {"extraction_mode": self.pdf_extraction_mode}
+    
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "Settings":
+        """Load and validate settings; raises ValueError describing every invalid field"""
+        data: Dict = {}
+        path = path or os.getenv("CHATBOT_CONFIG")
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        
+        for name in cls.model_fields:
+            if name in _STAGE_ENV_PREFIXES:
+                overrides = dict(data.get(name) or {})
+                for field in StageSettings.model_fields:
+                    value = os.getenv(f"{_STAGE_ENV_PREFIXES[name]}{field.upper()}")
+                    if not value and (name, field) in _LEGACY_ENV_ALIASES:
+                        value = os.getenv(_LEGACY_ENV_ALIASES[name, field])
+                    if value:
+                        overrides[field] = value
+                default = cls.model_fields[name].default
+                if default is not None:
+                    data[name] = {**default.model_dump(), **overrides}
+                elif overrides:
+                    # Optional stages only exist when configured and start from the stage they back up
+                    data[name] = {**data[_STAGE_INHERITS[name]], **overrides}
+                else:
+                    data.pop(name, None)
+            else:
+                value = os.getenv(name.upper())
+                if value:
+                    data[name] = value
+        
+        return cls.model_validate(data)
+
+_STAGE_ENV_PREFIXES = {"generation": "GENERATOR_", "evaluation": "EVALUATOR_", "hedge_generation": "HEDGE_"}
+_STAGE_INHERITS = {"hedge_generation": "generation"}
+# Older variable names that still configure a stage field
+_LEGACY_ENV_ALIASES = {
+    ("generation", "base_url"): "OPENROUTER_BASE_URL",
+    ("evaluation", "base_url"): "GEMINI_BASE_URL",
+}
+
+_STOPWORDS = frozenset(
+    "a an and are as at be but by do does did for from has have how i in is it me my of on or "
+    "so that the their them they this to was were what when where which who why will with you your".split()
+)
+
+# Dropped for retrieval, but they change what a question asks, so question matching keeps them
+_INTERROGATIVES = frozenset("how what when where which who whom whose why".split())
+_NEGATIONS = frozenset("neither never no nor not".split())
+# Question words that ask the same thing as another one; matching only ever sees the latter
+_INTERROGATIVE_ALIASES = {"which": "what", "whom": "who"}
+# A question with no question word that opens with one of these asks for a yes or a no
+_AUXILIARIES = frozenset(
+    "am are is was were do does did have has had can could will would shall should may might must "
+    "ain aren isn wasn weren don doesn didn haven hasn hadn couldn won wouldn shouldn".split()
+)
+# "Work with" only means "use" when the object is a technology: "who have you worked with" is about people
+_TECH_OBJECTS = r"(?:languages?|technolog(?:y|ies)|frameworks?|librar(?:y|ies)|tools?|databases?|stack)"
+# Wordings that ask the same thing, rewritten to one of them before matching
+_MATCH_REWRITES = [
+    (re.compile(r"\b(?:tell|talk) (?:me|us) about\b|\bdescribe\b"), "what"),
+    (re.compile(rf"\b({_TECH_OBJECTS}\b.*?)\bwork(?:ed|ing)? with\b"), r"\1use"),
+    (re.compile(rf"\bwork(?:ed|ing)? with\b(?=(?: \w+){{0,3}} {_TECH_OBJECTS}\b)"), "use"),
+    (re.compile(r"\bus(?:es|ed|ing)\b"), "use"),
+    (re.compile(r"\bprogramming languages?\b"), "languages"),
+    (re.compile(r"\b(?:job|position)\b"), "role"),
+]
+# Fillers that don't change what is asked, plus the stems contractions leave behind ("aren't" -> "aren not")
+_MATCH_STOPWORDS = (_STOPWORDS - _INTERROGATIVES) | _AUXILIARIES | frozenset(
+    "actually currently just please really".split()
+)
+
+def _extraction_cache_key(pdf_bytes: bytes, options: Dict) -> str:
+    """Content-address an extraction by PDF bytes, pypdf version and extraction options"""
+    digest = hashlib.sha256(pdf_bytes)
+    digest.update(pypdf.__version__.encode("utf-8"))
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def _read_extraction_cache(cache_path: str) -> Optional[str]:
+    """Return cached extracted text, or None if missing or unreadable"""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)["text"]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable extraction cache {cache_path}: {e}")
+        return None
+
+def _write_json_atomic(path: str, payload: Dict):
+    """Write JSON via a temp file and rename so readers never see a partial file"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _write_extraction_cache(cache_path: str, source: str, text: str, options: Dict):
+    """Atomically write extracted text so concurrent workers never see a partial file"""
+    cache_dir = os.path.dirname(cache_path)
+    _write_json_atomic(cache_path, {
+        "source": source,
+        "pypdf_version": pypdf.__version__,
+        "options": options,
+        "text": text,
+    })
+    
+    # Drop stale extractions of the same source so the cache doesn't grow on every edit;
+    # only "<name>-<sha256>.json", so linkedin.pdf leaves linkedin-old.pdf's entries alone
+    name = os.path.basename(cache_path).rsplit("-", 1)[0]
+    stale = re.compile(re.escape(name) + r"-[0-9a-f]{64}\.json")
+    for entry in os.listdir(cache_dir):
+        entry_path = os.path.join(cache_dir, entry)
+        if stale.fullmatch(entry) and entry_path != cache_path:
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercase word tokens for lexical retrieval, without stopwords"""
+    return [token for token in re.findall(r"[a-z0-9][a-z0-9+#]*", text.lower()) if token not in _STOPWORDS]
+
+def _chunk_text(text: str, section: str, max_chars: int) -> List[Tuple[str, str]]:
+    """Split text into (section, chunk) pairs of roughly max_chars along paragraph and line breaks"""
+    chunks = []
+    current = ""
+    for block in re.split(r"\n\s*\n|\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        if current and len(current) + len(block) + 1 > max_chars:
+            chunks.append((section, current))
+            current = ""
+        current = f"{current}\n{block}" if current else block
+    if current:
+        chunks.append((section, current))
+    return chunks
+
+class ProfileIndex:
+    """In-memory BM25 index over profile chunks, fully offline"""
+    
+    def __init__(self, chunks: List[Tuple[str, str]], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(_tokenize(text)) for _, text in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+    
+    def search(self, query: str, k: int) -> List[Tuple[str, str]]:
+        """Return the k best chunks for a query, in profile order"""
+        terms = set(_tokenize(query))
+        scores = []
+        for index, tf in enumerate(self.term_freqs):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            scores.append(score)
+        
+        ranked = [index for index in sorted(range(len(scores)), key=lambda i: -scores[i]) if scores[index] > 0][:k]
+        if not ranked:
+            # Nothing matched (e.g. small talk): the top of the profile is the best general context
+            ranked = list(range(min(k, len(self.chunks))))
+        return [self.chunks[index] for index in sorted(ranked)]
+
+class ProfileContext(BaseModel):
+    """Immutable profile snapshot shared by the chat and evaluator prompts
+    
+    The profile text is held once: either as the block both message lists send as their
+    second system message, or, for long profiles, as the chunks of the retrieval index.
+    The two instruction prompts around it carry no profile text.
+    """
+    model_config = ConfigDict(frozen=True, arbitrary_types_allowed=True)
+    
+    # Profile section sent verbatim to both models; empty when retrieval is active
+    block: str = ""
+    # Which sources had content, so a reload that finds one missing can be refused
+    has_summary: bool = False
+    has_linkedin: bool = False
+    # Content digest, used to skip no-op reloads and to tag request logs
+    version: str = ""
+    # Set for long profiles, which are retrieved per question instead of pasted into the prompts
+    index: Optional[ProfileIndex] = None
+    system_prompt: str = ""
+    evaluator_prompt: str = ""
+    # Digest of the profile version, static prompts and profile block, the per-snapshot part of the cache keys
+    prompt_fingerprint: str = ""
+
+def _normalize_message(message: str) -> str:
+    """Normalize a visitor message for cache lookups"""
+    return re.sub(r"\s+", " ", message.lower()).strip().rstrip("?!. ")
+
+def _expand_question(message: str) -> str:
+    """Lowercase a question, spell out its contractions and rewrite equivalent wordings"""
+    text = message.lower().replace("cannot", "can not")
+    # Contractions with or without the apostrophe: "don't"/"dont" -> "don not", "what's"/"whats" -> "what is"
+    text = re.sub(
+        r"\b(ain|aren|can|couldn|didn|doesn|don|hadn|hasn|haven|isn|shouldn|wasn|weren|won|wouldn)['’]?t\b",
+        r"\1 not", text,
+    )
+    text = re.sub(r"\b(how|what|when|where|who|why)['’]?s\b", r"\1 is", text)
+    for pattern, replacement in _MATCH_REWRITES:
+        text = pattern.sub(replacement, text)
+    return text
+
+def _match_tokens(message: str) -> List[str]:
+    """Word tokens for matching reworded questions: stopwords go, question words and negations stay"""
+    # Single letters are mostly contraction debris ("what's" -> "s")
+    return [
+        _INTERROGATIVE_ALIASES.get(token, token)
+        for token in re.findall(r"[a-z0-9][a-z0-9+#]*", _expand_question(message))
+        if token not in _MATCH_STOPWORDS and len(token) > 1
+    ]
+
+def _content_tokens(message: str) -> List[str]:
+    """Match tokens without the question words and negations, which _question_form compares instead"""
+    return [token for token in _match_tokens(message) if token not in _INTERROGATIVES and token not in _NEGATIONS]
+
+def _question_form(message: str) -> Tuple[frozenset, bool]:
+    """What a question asks for ("what", "when", ..., or "yes/no") and whether it is negated"""
+    tokens = set(_match_tokens(message))
+    kinds = tokens & _INTERROGATIVES
+    if not kinds:
+        words = re.findall(r"[a-z]+", _expand_question(message))
+        if words and words[0] in _AUXILIARIES:
+            kinds = {"yes/no"}
+    return frozenset(kinds), bool(tokens & _NEGATIONS)
+
+def _same_question_form(form: Tuple[frozenset, bool], other: Tuple[frozenset, bool]) -> bool:
+    """Whether two questions may ask the same thing
+    
+    Polarity must agree, and so must the question words when both have one; a question
+    without any ("Python experience?") is compatible with every form.
+    """
+    (kinds, negated), (other_kinds, other_negated) = form, other
+    if negated != other_negated:
+        return False
+    return not kinds or not other_kinds or bool(kinds & other_kinds)
+
+HISTORY_SUMMARY_CACHE_SIZE = 1024
+HISTORY_SUMMARY_WORKERS = 2
+
+# Rough chars-per-token ratio for English text; good enough for budgeting, not billing
+CHARS_PER_TOKEN = 4
+# Per-message framing overhead in chat completion prompts
+MESSAGE_TOKEN_OVERHEAD = 4
+# Don't bother keeping a truncated message shorter than this
+MIN_TRUNCATED_TOKENS = 32
+
+def _estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _trim_history(history: List[Dict], budget: int) -> Tuple[List[Dict], int]:
+    """Keep the most recent messages that fit in budget tokens, truncating the oldest one kept
+    
+    Returns (kept, dropped), where dropped counts messages left out entirely.
+    """
+    kept = []
+    remaining = budget
+    for msg in reversed(history):
+        cost = _estimate_tokens(str(msg.get("content", ""))) + MESSAGE_TOKEN_OVERHEAD
+        if cost <= remaining:
+            kept.append(msg)
+            remaining -= cost
+            continue
+        allowance = remaining - MESSAGE_TOKEN_OVERHEAD
+        if allowance >= MIN_TRUNCATED_TOKENS:
+            content = str(msg.get("content", ""))
+            kept.append({**msg, "content": content[:allowance * CHARS_PER_TOKEN - 2] + " …"})
+        break
+    kept.reverse()
+    return kept, len(history) - len(kept)
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _prefix_digests(history: List[Dict]) -> List[str]:
+    """Chained digests where entry i identifies history[:i + 1]"""
+    digests = []
+    digest = hashlib.sha256()
+    for msg in history:
+        digest.update(json.dumps([msg.get("role"), msg.get("content")], ensure_ascii=False).encode("utf-8"))
+        digests.append(digest.copy().hexdigest())
+    return digests
+
+class HistorySummaries:
+    """Running summaries of conversation prefixes, keyed by the digest of the summarized messages
+    
+    Histories only ever grow within a session, so a summary cached for one turn's prefix is
+    found again on every later turn of the same session.
+    """
+    
+    def __init__(self, max_entries: int = HISTORY_SUMMARY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+    
+    def latest(self, digests: List[str]) -> Tuple[int, Optional[str]]:
+        """Return (covered, summary) for the longest summarized prefix, (0, None) if there is none"""
+        with self._lock:
+            for index in range(len(digests) - 1, -1, -1):
+                summary = self._entries.get(digests[index])
+                if summary is not None:
+                    self._entries.move_to_end(digests[index])
+                    return index + 1, summary
+        return 0, None
+    
+    def claim(self, digest: str) -> bool:
+        """Reserve a prefix for summarization; False if it is done or already under way"""
+        with self._lock:
+            if digest in self._entries or digest in self._pending:
+                return False
+            self._pending.add(digest)
+            return True
+    
+    def store(self, digest: str, summary: str):
+        with self._lock:
+            self._pending.discard(digest)
+            self._entries[digest] = summary
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def release(self, digest: str):
+        with self._lock:
+            self._pending.discard(digest)
+
+class AnswerBank:
+    """Vetted answers to common first-turn questions, precomputed by build_answer_bank.py"""
+    
+    def __init__(self, entries: List[Dict[str, str]], profile_version: str = "", min_similarity: float = 0.75):
+        self.entries = entries
+        self.profile_version = profile_version
+        self.min_similarity = min_similarity
+        self._exact = {_normalize_message(entry["question"]): entry for entry in entries}
+        self._shingle_sets = [
+            (_shingles(entry["question"]), _question_form(entry["question"]), entry)
+            for entry in entries
+        ]
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def match(self, message: str) -> Optional[Dict[str, str]]:
+        """Exact match on the normalized question, else the closest by Jaccard similarity of shingles
+        
+        Scored like the near-duplicate cache, exactly rather than by MinHash since the bank is small.
+        A fuzzy match must ask the same kind of question: "what" matches "which" and "tell me
+        about", but "when" never matches "why", and a negated question never matches its
+        positive form.
+        """
+        entry = self._exact.get(_normalize_message(message))
+        if entry is not None:
+            return entry
+        
+        shingles = _shingles(message)
+        if not shingles:
+            return None
+        form = _question_form(message)
+        best, best_score = None, 0.0
+        for question_shingles, question_form, entry in self._shingle_sets:
+            if not question_shingles or not _same_question_form(form, question_form):
+                continue
+            score = len(shingles & question_shingles) / len(shingles | question_shingles)
+            if score > best_score:
+                best, best_score = entry, score
+        return best if best_score >= self.min_similarity else None
+    
+    @classmethod
+    def load(cls, path: str, min_similarity: float) -> Optional["AnswerBank"]:
+        """Load a bank file, or None if there isn't one"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        return cls(data["answers"], data.get("profile_version", ""), min_similarity)
+    
+    def save(self, path: str, model: str):
+        _write_json_atomic(path, {
+            "profile_version": self.profile_version,
+            "model": model,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "answers": self.entries,
+        })
+
+class ResponseCache:
+    """Thread-safe LRU cache with TTL for vetted replies"""
+    
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key: str, value: str):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+NEAR_DUPLICATE_NGRAM = 3
+NEAR_DUPLICATE_BANDS = 16
+NEAR_DUPLICATE_ROWS = 4
+NEAR_DUPLICATE_AUDIT_WORKERS = 2
+# Universal hashes (a*h + b) mod p standing in for random permutations; fixed seed so signatures are stable
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_rng = random.Random(0)
+_MINHASH_SEEDS = [
+    (_minhash_rng.randrange(1, _MINHASH_PRIME), _minhash_rng.randrange(_MINHASH_PRIME))
+    for _ in range(NEAR_DUPLICATE_BANDS * NEAR_DUPLICATE_ROWS)
+]
+
+def _shingles(message: str) -> frozenset:
+    """Character n-grams of each of the message's content words, hashed to 32 bits
+    
+    Per word, so word order doesn't matter and a typo or plural only changes a few grams,
+    while a different word ("Python" / "Java") changes all of its own.
+    """
+    grams = set()
+    for word in set(_content_tokens(message)):
+        padded = f" {word} "
+        grams.update(padded[i:i + NEAR_DUPLICATE_NGRAM] for i in range(len(padded) - NEAR_DUPLICATE_NGRAM + 1))
+    return frozenset(
+        int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "big") for gram in grams
+    )
+
+def _minhash_bands(shingles: frozenset) -> List[Tuple[int, ...]]:
+    """MinHash signature split into LSH bands"""
+    signature = [min((a * h + b) % _MINHASH_PRIME for h in shingles) for a, b in _MINHASH_SEEDS]
+    return [
+        tuple(signature[band * NEAR_DUPLICATE_ROWS:(band + 1) * NEAR_DUPLICATE_ROWS])
+        for band in range(NEAR_DUPLICATE_BANDS)
+    ]
+
+class NearDuplicateCache:
+    """Bounded MinHash/LSH index of vetted first-turn replies, so reworded questions can reuse them
+    
+    LSH only narrows the candidates; a hit needs a compatible question form (see
+    _same_question_form) and the exact Jaccard similarity of the character shingles to
+    reach the threshold.
+    Entries are partitioned by scope so a reply is never reused across prompts, models or
+    special behaviours.
+    """
+    
+    def __init__(self, max_entries: int, ttl_seconds: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        # (scope, normalized question) -> (stored at, shingles, bands, question form, question, reply)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, frozenset, List[Tuple[int, ...]], Tuple[frozenset, bool], str, str]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], set] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, scope: str, message: str) -> Optional[Tuple[Tuple[str, str], str, str, float]]:
+        """Return (key, question, reply, similarity) for the closest cached question, if close enough"""
+        shingles = _shingles(message)
+        if not shingles:
+            return None
+        bands = _minhash_bands(shingles)
+        form = _question_form(message)
+        with self._lock:
+            candidates = set()
+            for index, band in enumerate(bands):
+                candidates |= self._buckets.get((scope, index, band), set())
+            
+            best, best_score = None, 0.0
+            now = time.monotonic()
+            for key in candidates:
+                stored_at, cached_shingles, _, cached_form, question, reply = self._entries[key]
+                if now - stored_at > self.ttl_seconds:
+                    self._remove(key)
+                    continue
+                if not _same_question_form(form, cached_form):
+                    continue
+                score = len(shingles & cached_shingles) / len(shingles | cached_shingles)
+                if score > best_score:
+                    best, best_score = (key, question, reply, score), score
+            
+            if best is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best[0])
+            self.hits += 1
+            return best
+    
+    def put(self, scope: str, message: str, reply: str):
+        if self.max_entries <= 0:
+            return
+        shingles = _shingles(message)
+        if not shingles:
+            return
+        bands = _minhash_bands(shingles)
+        key = (scope, _normalize_message(message))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (
+                time.monotonic(), shingles, bands, _question_form(message), message, reply
+            )
+            for index, band in enumerate(bands):
+                self._buckets.setdefault((scope, index, band), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+    
+    def discard(self, key: Tuple[str, str]):
+        with self._lock:
+            self._remove(key)
+    
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for index, band in enumerate(entry[2]):
+            bucket = self._buckets.get((key[0], index, band))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[(key[0], index, band)]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+    
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one; every caller gets the leader's result"""
+    
+    def __init__(self):
+        self._flights: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key: str, fn: Callable) -> Tuple[object, bool]:
+        """Return (result, shared), where shared is True for callers that waited on another's call"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+        if not leader:
+            return flight.result(), True
+        
+        try:
+            flight.set_result(fn())
+        except BaseException as e:
+            flight.set_exception(e)
+        finally:
+            with self._lock:
+                del self._flights[key]
+        return flight.result(), False
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight; the shared call survives any one caller being cancelled"""
+    
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Task] = {}
+    
+    async def do(self, key: str, fn: Callable) -> Tuple[object, bool]:
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if not shared:
+            flight = self._flights[key] = asyncio.ensure_future(fn())
+            flight.add_done_callback(lambda done: self._flights.pop(key, None))
+        return await asyncio.shield(flight), shared
+
+class _Broadcast:
+    """One iterator's values, replayed to any number of subscribers
+    
+    Nothing runs on a thread of its own: whichever subscriber wants the next value while no
+    one else is fetching it pulls it from the source, in the context the run started in.
+    When the last subscriber leaves before the source is exhausted, the source is closed.
+    """
+    
+    def __init__(self, source: Iterator, context: contextvars.Context, retire: Callable):
+        self.latest = None
+        self.count = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._abandoned = False
+        self._source = source
+        self._context = context
+        self._retire = retire
+        self._fetching = False
+        self._changed = threading.Condition()
+    
+    def join(self) -> bool:
+        """Count a new subscriber; False if everyone already left and the run was abandoned"""
+        with self._changed:
+            if self._abandoned:
+                return False
+            self.subscribers += 1
+            return True
+    
+    def subscribe(self) -> Iterator:
+        """Yield the latest value whenever it changes; values are cumulative, so skipped ones aren't missed"""
+        seen = 0
+        try:
+            while True:
+                with self._changed:
+                    self._changed.wait_for(lambda: self.count > seen or self.done or not self._fetching)
+                    count, latest, done, error = self.count, self.latest, self.done, self.error
+                    fetch = count == seen and not done
+                    if fetch:
+                        self._fetching = True
+                if fetch:
+                    self._fetch()
+                elif count > seen:
+                    seen = count
+                    yield latest
+                else:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self._leave()
+    
+    def _fetch(self):
+        """Pull the next value from the source on behalf of every subscriber"""
+        try:
+            item = self._context.run(next, self._source)
+        except StopIteration:
+            self._finish(None)
+        except Exception as e:
+            self._finish(e)
+        except BaseException as e:
+            self._finish(e)
+            raise
+        else:
+            with self._changed:
+                self.latest, self.count, self._fetching = item, self.count + 1, False
+                self._changed.notify_all()
+    
+    def _finish(self, error: Optional[BaseException]):
+        self._retire(self)
+        with self._changed:
+            self.done, self.error, self._fetching = True, error, False
+            self._changed.notify_all()
+    
+    def _leave(self):
+        with self._changed:
+            self.subscribers -= 1
+            abandoned = not self.subscribers and not self.done
+            if abandoned:
+                self.done = self._abandoned = True
+        if abandoned:
+            # Nobody is listening any more, so stop the upstream work rather than finish it
+            self._retire(self)
+            self._context.run(self._source.close)
+
+class StreamSingleFlight:
+    """SingleFlight for generators: concurrent callers with the same key share one run
+    
+    The callers take turns driving the run, so it carries on for the others if the first
+    caller's visitor goes away, and stops once all of them have. Callers that join late
+    start from the latest value.
+    """
+    
+    def __init__(self):
+        self._flights: Dict[str, _Broadcast] = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key: str, start: Callable[[], Iterator]) -> Tuple[Iterator, bool]:
+        """Return (values, shared), where shared is True for callers that joined another's run"""
+        with self._lock:
+            flight = self._flights.get(key)
+            shared = flight is not None and flight.join()
+            if not shared:
+                # Pulls run in the first caller's context, so its request trace records the upstream work
+                flight = self._flights[key] = _Broadcast(
+                    start(), contextvars.copy_context(), functools.partial(self._retire, key)
+                )
+                flight.join()
+        return flight.subscribe(), shared
+    
+    def _retire(self, key: str, flight: _Broadcast):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+class _AsyncBroadcast:
+    """asyncio counterpart of _Broadcast; a fetch runs as a task, so a cancelled subscriber doesn't abort it"""
+    
+    def __init__(self, source: AsyncIterator, context: contextvars.Context, retire: Callable):
+        self.latest = None
+        self.count = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._abandoned = False
+        self._source = source
+        self._context = context
+        self._retire = retire
+        self._fetching: Optional[asyncio.Future] = None
+        self._closing = set()
+    
+    def join(self) -> bool:
+        if self._abandoned:
+            return False
+        self.subscribers += 1
+        return True
+    
+    async def subscribe(self) -> AsyncIterator:
+        seen = 0
+        try:
+            while True:
+                if self.count > seen:
+                    seen = self.count
+                    yield self.latest
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    if self._fetching is None:
+                        self._fetching = self._context.run(asyncio.ensure_future, self._fetch())
+                    await asyncio.shield(self._fetching)
+        finally:
+            self._leave()
+    
+    async def _fetch(self):
+        try:
+            self.latest = await self._source.__anext__()
+            self.count += 1
+        except StopAsyncIteration:
+            self._finish(None)
+        except Exception as e:
+            self._finish(e)
+        finally:
+            self._fetching = None
+    
+    def _finish(self, error: Optional[BaseException]):
+        self._retire(self)
+        self.done, self.error = True, error
+    
+    def _leave(self):
+        self.subscribers -= 1
+        if self.subscribers or self.done:
+            return
+        self.done = self._abandoned = True
+        self._retire(self)
+        closing = self._context.run(asyncio.ensure_future, self._close())
+        # Hold a reference so the task isn't garbage collected mid-flight
+        self._closing.add(closing)
+        closing.add_done_callback(self._closing.discard)
+    
+    async def _close(self):
+        """Stop the upstream work nobody is listening to any more"""
+        fetching = self._fetching
+        if fetching is not None:
+            fetching.cancel()
+            await asyncio.wait([fetching])
+        await self._source.aclose()
+
+class AsyncStreamSingleFlight:
+    """asyncio counterpart of StreamSingleFlight"""
+    
+    def __init__(self):
+        self._flights: Dict[str, _AsyncBroadcast] = {}
+    
+    def do(self, key: str, start: Callable[[], AsyncIterator]) -> Tuple[AsyncIterator, bool]:
+        flight = self._flights.get(key)
+        shared = flight is not None and flight.join()
+        if not shared:
+            flight = self._flights[key] = _AsyncBroadcast(
+                start(), contextvars.copy_context(), functools.partial(self._retire, key)
+            )
+            flight.join()
+        return flight.subscribe(), shared
+    
+    def _retire(self, key: str, flight: _AsyncBroadcast):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+class EvaluationPolicy:
+    """Decide per reply whether the Gemini evaluator is worth a round trip"""
+    
+    def __init__(self, mode: str = "always", sample_rate: float = 0.25, skip_on_cache_hit: bool = True,
+                 rng: Optional[random.Random] = None):
+        if mode not in EVALUATION_POLICIES:
+            raise ValueError(f"Unknown EVALUATION_POLICY '{mode}', expected one of {', '.join(EVALUATION_POLICIES)}")
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"EVALUATION_SAMPLE_RATE must be between 0 and 1, got {sample_rate}")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.skip_on_cache_hit = skip_on_cache_hit
+        self._rng = rng or random.Random()
+    
+    @staticmethod
+    def precheck(reply: str) -> Optional[str]:
+        """Return why a reply looks suspicious, or None if it passes the local checks"""
+        stripped = reply.strip()
+        if len(stripped) < PRECHECK_MIN_CHARS:
+            return "too-short"
+        if len(stripped) > PRECHECK_MAX_CHARS:
+            return "too-long"
+        if _REFUSAL_PATTERNS.search(stripped):
+            return "refusal"
+        if _OUT_OF_CHARACTER_PATTERNS.search(stripped):
+            return "out-of-character"
+        return None
+    
+    def decide(self, reply: str, cached: bool = False) -> Tuple[bool, str]:
+        """Return (evaluate, reason) for a reply"""
+        if cached and self.skip_on_cache_hit:
+            return False, "cache-hit"
+        if self.mode == "always":
+            return True, "always"
+        if self.mode == "sampled":
+            if self._rng.random() < self.sample_rate:
+                return True, "sampled"
+            return False, "not-sampled"
+        suspicion = self.precheck(reply)
+        if suspicion:
+            return True, f"precheck-{suspicion}"
+        return False, "precheck-clean"
+
+# Threads racing primary and hedge generation calls; two per in-flight hedged request
+HEDGE_WORKERS = 64
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+class HedgeDelay:
+    """Adaptive hedge delay: a percentile of recent primary first-token latencies, clamped"""
+    
+    def __init__(self, percentile: float, initial: float, minimum: float, maximum: float,
+                 window: int = HEDGE_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.percentile = percentile
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+    
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+    
+    def current(self) -> float:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                delay = self.initial
+            else:
+                ordered = sorted(self._samples)
+                delay = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+        return min(self.maximum, max(self.minimum, delay))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+def _is_upstream_failure(error: Exception) -> bool:
+    """Whether an error says the endpoint is unhealthy, as opposed to a bad request"""
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 429)
+    return True
+
+class CircuitBreaker:
+    """Error-rate and latency based circuit breaker for one upstream endpoint
+    
+    closed: calls flow and outcomes are recorded in a rolling window. open: calls fail fast
+    until open_seconds pass. half_open: one probe call is let through; success closes the
+    circuit, failure re-opens it.
+    """
+    
+    STATES = ("closed", "half_open", "open")
+    
+    def __init__(self, name: str, slow_call_seconds: float, failure_rate: float = 0.5, window: int = 20,
+                 min_calls: int = 5, open_seconds: float = 30.0):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    def available(self) -> bool:
+        """Whether a call would currently be let through, without claiming a probe"""
+        with self._lock:
+            if self.state == "open":
+                return time.monotonic() - self._opened_at >= self.open_seconds
+            return not (self.state == "half_open" and self._probing)
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._transition("half_open")
+            if self.state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+    
+    def record(self, ok: bool, seconds: float = 0.0):
+        healthy = ok and seconds <= self.slow_call_seconds
+        with self._lock:
+            if self.state == "half_open":
+                self._probing = False
+                self._transition("closed" if healthy else "open")
+                return
+            if self.state == "open":
+                return
+            self._outcomes.append(healthy)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._transition("open")
+    
+    def release(self):
+        """Give back a probe whose call was abandoned before it finished"""
+        with self._lock:
+            self._probing = False
+    
+    def call(self, fn: Callable):
+        if not self.allow():
+            metrics.inc("chatbot_circuit_rejections_total", help="Calls failed fast by an open circuit", endpoint=self.name)
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            self._record_error(e, time.perf_counter() - started)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(True, time.perf_counter() - started)
+        return result
+    
+    async def acall(self, fn: Callable):
+        if not self.allow():
+            metrics.inc("chatbot_circuit_rejections_total", help="Calls failed fast by an open circuit", endpoint=self.name)
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        started = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as e:
+            self._record_error(e, time.perf_counter() - started)
+            raise
+        except BaseException:
+            # Cancelled, e.g. a losing hedge; says nothing about the endpoint
+            self.release()
+            raise
+        self.record(True, time.perf_counter() - started)
+        return result
+    
+    def _record_error(self, error: Exception, seconds: float = 0.0):
+        if isinstance(error, DeadlineExceededError) and seconds <= self.slow_call_seconds:
+            # Cut short by the request's own budget before the endpoint had shown itself slow
+            self.release()
+        elif _is_upstream_failure(error):
+            self.record(False)
+        else:
+            self.record(True)
+    
+    def _transition(self, state: str):
+        # Caller holds the lock
+        if state == self.state:
+            return
+        self.state = state
+        if state == "open":
+            self._opened_at = time.monotonic()
+            logger.warning(f"Circuit for {self.name} opened; failing fast for {self.open_seconds:g}s")
+        elif state == "closed":
+            self._outcomes.clear()
+            logger.info(f"Circuit for {self.name} closed")
+        metrics.inc("chatbot_circuit_transitions_total", help="Circuit breaker state changes",
+                    endpoint=self.name, state=state)
+
+class UpstreamBusyError(Exception):
+    """Raised when an upstream call can't be admitted within the queue deadline"""
+
+class _SlotWaiter:
+    """A queued claim on an UpstreamLimiter slot; wake() may be called from any thread"""
+    
+    def __init__(self, wake: Callable):
+        self.wake = wake
+        self.granted = False
+
+class HeldSlot:
+    """An UpstreamLimiter slot kept past the call that took it, e.g. by an open stream; released once"""
+    
+    def __init__(self, limiter: "UpstreamLimiter"):
+        self._limiter = limiter
+        self._released = False
+        self._lock = threading.Lock()
+    
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._limiter.release()
+
+class UpstreamLimiter:
+    """Concurrency cap and token-bucket rate limit for one upstream, with a bounded FIFO wait queue
+    
+    A call first reserves a rate token, then waits for a concurrency slot. It is rejected
+    with UpstreamBusyError as soon as the outcome is known: the queue is full, or the next
+    token is further out than max_wait. Otherwise it waits at most max_wait for a slot.
+    0 disables max_concurrent or requests_per_minute.
+    """
+    
+    def __init__(self, name: str, max_concurrent: int = 0, requests_per_minute: float = 0.0, burst: int = 1,
+                 max_queue: int = 64, max_wait: float = 10.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: deque = deque()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+    
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+    
+    def _reject(self, reason: str):
+        metrics.inc("chatbot_upstream_rejections_total", help="Upstream calls turned away by admission control",
+                    upstream=self.name, reason=reason)
+        raise UpstreamBusyError(f"{self.name} is busy ({reason})")
+    
+    def _reserve_token(self, deadline: float) -> float:
+        """Reserve the next rate token and return when it becomes usable"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            # Tokens go negative as calls reserve future ones
+            ready_at = now + max(0.0, (1.0 - self._tokens) / self.rate)
+            if ready_at > deadline:
+                self._reject("rate_limited")
+            self._tokens -= 1.0
+            return ready_at
+    
+    def _refund_token(self):
+        if self.rate:
+            with self._lock:
+                self._tokens = min(float(self.burst), self._tokens + 1.0)
+    
+    def _enqueue(self, wake_factory: Callable) -> Optional[_SlotWaiter]:
+        """Take a free slot (returns None) or join the queue (returns the waiter)"""
+        with self._lock:
+            if not self.max_concurrent or self.active < self.max_concurrent:
+                self.active += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._reject("queue_full")
+            waiter = _SlotWaiter(wake_factory())
+            self._waiters.append(waiter)
+            return waiter
+    
+    def _withdraw(self, waiter: _SlotWaiter) -> bool:
+        """Leave the queue; False if a slot was granted in the meantime and is now the caller's"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            return True
+    
+    def release(self):
+        with self._lock:
+            if not self.max_concurrent:
+                self.active -= 1
+                return
+            # Hand the slot straight to the oldest waiter so it can't be barged
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.wake()
+                return
+            self.active -= 1
+    
+    def _admitted(self, started: float):
+        waited = time.monotonic() - started
+        metrics.observe("chatbot_upstream_queue_seconds", waited, help="Time calls waited for admission",
+                        upstream=self.name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage("queue", waited)
+    
+    def _wait_budget(self) -> float:
+        # Waiting past the request's own deadline would only delay its failure
+        deadline = _current_deadline()
+        return self.max_wait if deadline is None else min(self.max_wait, deadline.remaining())
+    
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self._wait_budget()
+        ready_at = self._reserve_token(deadline)
+        try:
+            event = threading.Event()
+            waiter = self._enqueue(lambda: event.set)
+        except UpstreamBusyError:
+            self._refund_token()
+            raise
+        if waiter is not None and not event.wait(max(0.0, deadline - time.monotonic())) and self._withdraw(waiter):
+            self._refund_token()
+            self._reject("timeout")
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._admitted(started)
+    
+    async def aacquire(self):
+        started = time.monotonic()
+        deadline = started + self._wait_budget()
+        ready_at = self._reserve_token(deadline)
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        
+        def wake_factory():
+            return lambda: loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+        
+        try:
+            waiter = self._enqueue(wake_factory)
+        except UpstreamBusyError:
+            self._refund_token()
+            raise
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(granted, max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                if self._withdraw(waiter):
+                    self._refund_token()
+                    self._reject("timeout")
+            except BaseException:
+                if self._withdraw(waiter):
+                    self._refund_token()
+                else:
+                    self.release()
+                raise
+        try:
+            delay = ready_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self.release()
+            raise
+        self._admitted(started)
+    
+    def call(self, fn: Callable, hold: bool = False):
+        """Run fn in a slot; with hold, a successful call keeps it and returns (result, HeldSlot)"""
+        self.acquire()
+        try:
+            result = fn()
+        except BaseException:
+            self.release()
+            raise
+        if hold:
+            return result, HeldSlot(self)
+        self.release()
+        return result
+    
+    async def acall(self, fn: Callable, hold: bool = False):
+        await self.aacquire()
+        try:
+            result = await fn()
+        except BaseException:
+            self.release()
+            raise
+        if hold:
+            return result, HeldSlot(self)
+        self.release()
+        return result
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether an upstream error is transient enough to be worth another attempt"""
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 409, 429)
+    return isinstance(error, APIConnectionError)
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the upstream asked us to wait via Retry-After(-Ms), if it did"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000.0)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    """Retry transient upstream failures with capped exponential backoff and full jitter
+    
+    A Retry-After from the upstream takes precedence over the computed backoff. A retry
+    is only started if its delay ends before the active request's deadline (outside a
+    request, deadline_seconds from the first attempt).
+    """
+    
+    def __init__(self, name: str, max_retries: int, base_delay: float, max_delay: float, deadline_seconds: float,
+                 rng: Optional[random.Random] = None):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_seconds = deadline_seconds
+        self._rng = rng or random.Random()
+    
+    def _deadline(self) -> float:
+        deadline = _current_deadline()
+        return deadline.expires if deadline is not None else time.perf_counter() + self.deadline_seconds
+    
+    def _next_delay(self, attempt: int, error: Exception, deadline: float) -> Optional[float]:
+        """Seconds to sleep before retry number attempt, or None to give up"""
+        if attempt > self.max_retries or not _is_retryable(error):
+            return None
+        delay = _retry_after(error)
+        if delay is None:
+            delay = self._rng.uniform(0.0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if time.perf_counter() + delay >= deadline:
+            metrics.inc("chatbot_upstream_retries_abandoned_total", help="Retries skipped because they would pass the request deadline",
+                        upstream=self.name)
+            return None
+        
+        reason = str(error.status_code) if isinstance(error, APIStatusError) else "connection"
+        metrics.inc("chatbot_upstream_retries_total", help="Upstream calls retried after a transient failure",
+                    upstream=self.name, reason=reason)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.retries += 1
+        logger.warning(f"{self.name} call failed ({error}); retry {attempt}/{self.max_retries} in {delay:.2f}s")
+        return delay
+    
+    def call(self, fn: Callable):
+        deadline = self._deadline()
+        for attempt in itertools.count(1):
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+    
+    async def acall(self, fn: Callable):
+        deadline = self._deadline()
+        for attempt in itertools.count(1):
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+_TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Metrics:
+    """Process-wide counters and histograms rendered in Prometheus text format"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Tuple[Tuple[str, str], ...], Histogram]] = {}
+        self._counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: Dict[str, Callable[[], List[Tuple[str, Dict[str, str], float]]]] = {}
+    
+    def observe(self, name: str, value: float, help: str = "", buckets: Tuple[float, ...] = _LATENCY_BUCKETS, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+            if help:
+                self._help.setdefault(name, help)
+    
+    def inc(self, name: str, value: float = 1.0, help: str = "", **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+            if help:
+                self._help.setdefault(name, help)
+    
+    def set_collector(self, name: str, collect: Callable[[], List[Tuple[str, Dict[str, str], float]]]):
+        """Register a callback returning (metric, labels, value) gauges read at scrape time"""
+        with self._lock:
+            self._collectors[name] = collect
+    
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        le = 'le="%s"' % bound
+                        lines.append(f"{name}_bucket{_format_labels(key, le)} {count}")
+                    le = 'le="+Inf"'
+                    lines.append(f"{name}_bucket{_format_labels(key, le)} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+            collectors = list(self._collectors.values())
+        
+        gauges: Dict[str, List[str]] = {}
+        for collect in collectors:
+            try:
+                for name, labels, value in collect():
+                    key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+                    gauges.setdefault(name, []).append(f"{name}{_format_labels(key)} {value}")
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        for name, samples in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class DeadlineExceededError(Exception):
+    """Raised when the request's time budget runs out before or during an upstream call"""
+
+class Deadline:
+    """End-to-end time budget of one visitor request, consulted by every stage it runs"""
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.perf_counter() + seconds
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.perf_counter())
+
+# A timeout cut to less than this share of the stage's own is the deadline's doing; above it, the
+# stage's timeout would have fired at much the same moment and the endpoint takes the blame
+DEADLINE_BINDING_RATIO = 0.9
+
+def _deadline_bound(timeout: httpx.Timeout, read_timeout: float) -> bool:
+    """Whether the request deadline, not the stage's read timeout, set the limit for a call"""
+    return timeout.read is not None and timeout.read < read_timeout * DEADLINE_BINDING_RATIO
+
+def _call_within_deadline(fn: Callable, timeout: httpx.Timeout, read_timeout: float):
+    """Run fn(timeout), blaming a timeout that was cut down to the request's budget on the deadline"""
+    try:
+        return fn(timeout)
+    except APITimeoutError as e:
+        if _deadline_bound(timeout, read_timeout):
+            raise DeadlineExceededError(f"Request deadline passed during the call ({timeout.read:.1f}s budget)") from e
+        raise
+
+async def _acall_within_deadline(fn: Callable, timeout: httpx.Timeout, read_timeout: float):
+    try:
+        return await fn(timeout)
+    except APITimeoutError as e:
+        if _deadline_bound(timeout, read_timeout):
+            raise DeadlineExceededError(f"Request deadline passed during the call ({timeout.read:.1f}s budget)") from e
+        raise
+
+class RequestTrace:
+    """Per-request timings and token usage, logged as one structured line
+    
+    Also pins the profile snapshot a request started with, so a hot reload mid-request
+    can't mix profile versions between generation and evaluation.
+    """
+    
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        self.regenerated = False
+        self.hedged = ""
+        self.retries = 0
+        self.deadline: Optional[Deadline] = None
+        self.budget_skips: List[str] = []
+        self.coalesced = False
+        self.cache_hit = False
+        self.near_duplicate = False
+        self.evaluation = ""
+        self.answer_bank = False
+        self.busy = False
+        self.profile = None
+        self.total = 0.0
+    
+    def add_stage(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+    
+    def add_tokens(self, stage: str, direction: str, count: int):
+        stage_tokens = self.tokens.setdefault(stage, {})
+        stage_tokens[direction] = stage_tokens.get(direction, 0) + count
+    
+    def to_dict(self) -> Dict:
+        return {
+            "handler": self.handler,
+            "total_seconds": round(self.total, 4),
+            "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+            "tokens": self.tokens,
+            "regenerated": self.regenerated,
+            "hedged": self.hedged,
+            "retries": self.retries,
+            "budget_skips": self.budget_skips,
+            "coalesced": self.coalesced,
+            "cache_hit": self.cache_hit,
+            "near_duplicate": self.near_duplicate,
+            "answer_bank": self.answer_bank,
+            "busy": self.busy,
+            "evaluation": self.evaluation,
+            "profile_version": self.profile.version if self.profile is not None else "",
+        }
+
+_current_trace = contextvars.ContextVar("request_trace", default=None)
+
+def _note_trace(**fields):
+    """Set fields on the active request trace, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        for field, value in fields.items():
+            setattr(trace, field, value)
+
+def _current_deadline() -> Optional[Deadline]:
+    """The active request's deadline, or None outside a request"""
+    trace = _current_trace.get()
+    return trace.deadline if trace is not None else None
+
+@contextmanager
+def _timed_stage(stage: str):
+    """Time a pipeline stage into the stage histogram and the active trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("chatbot_stage_seconds", elapsed, help="Wall time per pipeline stage", stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(stage, elapsed)
+
+def _record_usage(stage: str, usage):
+    """Record prompt/completion token counts from an API usage block"""
+    if usage is None:
+        return
+    trace = _current_trace.get()
+    for direction, attribute in (("input", "prompt_tokens"), ("output", "completion_tokens")):
+        count = getattr(usage, attribute, None)
+        if count is None:
+            continue
+        metrics.observe("chatbot_stage_tokens", count, help="Tokens per upstream call",
+                        buckets=_TOKEN_BUCKETS, stage=stage, direction=direction)
+        metrics.inc("chatbot_tokens_total", count, help="Tokens exchanged with upstreams", stage=stage, direction=direction)
+        if trace is not None:
+            trace.add_tokens(stage, direction, count)
+
+def _finish_trace(trace: RequestTrace):
+    trace.total = time.perf_counter() - trace.started
+    metrics.observe("chatbot_request_seconds", trace.total, help="End-to-end chat latency",
+                    handler=trace.handler, cache_hit=str(trace.cache_hit).lower())
+    metrics.inc("chatbot_requests_total", help="Chat requests handled", handler=trace.handler)
+    if trace.regenerated:
+        metrics.inc("chatbot_regenerations_total", help="Replies regenerated after a rejection")
+    logger.info(f"Request metrics: {json.dumps(trace.to_dict())}")
+
+def traced_request(handler: str):
+    """Wrap a chat entry point (plain, async, generator or async generator) in a RequestTrace"""
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def async_gen_wrapper(*args, **kwargs):
+                trace = RequestTrace(handler)
+                steps = fn(*args, **kwargs)
+                try:
+                    while True:
+                        # Re-enter the trace for every step; Gradio may resume us from another context
+                        token = _current_trace.set(trace)
+                        try:
+                            item = await steps.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            _current_trace.reset(token)
+                        yield item
+                finally:
+                    await steps.aclose()
+                    _finish_trace(trace)
+            return async_gen_wrapper
+        
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                trace = RequestTrace(handler)
+                steps = fn(*args, **kwargs)
+                try:
+                    while True:
+                        token = _current_trace.set(trace)
+                        try:
+                            item = next(steps)
+                        except StopIteration:
+                            break
+                        finally:
+                            _current_trace.reset(token)
+                        yield item
+                finally:
+                    steps.close()
+                    _finish_trace(trace)
+            return gen_wrapper
+        
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                trace = RequestTrace(handler)
+                token = _current_trace.set(trace)
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _current_trace.reset(token)
+                    _finish_trace(trace)
+            return async_wrapper
+        
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = RequestTrace(handler)
+            token = _current_trace.set(trace)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _current_trace.reset(token)
+                _finish_trace(trace)
+        return wrapper
+    return decorator
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """Serve metrics.render() at /metrics on a daemon thread"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics available at http://0.0.0.0:{port}/metrics")
+    return server
+
+class ProfileWatcher:
+    """Polls files by mtime and size and calls reload once a change has settled
+    
+    A change is acted on only after the file looks the same on two consecutive polls, so
+    a save that is still being written isn't picked up half-way.
+    """
+    
+    def __init__(self, paths: List[str], reload: Callable[[], object], interval: float):
+        self.paths = paths
+        self.reload = reload
+        self.interval = interval
+        self._seen = {path: self._signature(path) for path in paths}
+        self._pending: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-watcher", daemon=True)
+    
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def poll(self) -> bool:
+        """Check the files once; returns True if a reload was triggered"""
+        settled = False
+        for path in self.paths:
+            signature = self._signature(path)
+            if signature == self._seen[path]:
+                self._pending.pop(path, None)
+                continue
+            if path in self._pending and self._pending[path] == signature:
+                self._seen[path] = signature
+                del self._pending[path]
+                settled = True
+            else:
+                self._pending[path] = signature
+        if settled:
+            self.reload()
+        return settled
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Profile reload failed: {e}")
+
+class StartupTimer:
+    """Collect wall-clock durations of cold-start stages for the startup report"""
+    
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+    
+    def record(self, name: str, seconds: float):
+        self.stages.append((name, seconds))
+    
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+    
+    def report(self) -> str:
+        total = sum(seconds for _, seconds in self.stages)
+        parts = [f"{name}={seconds:.3f}s" for name, seconds in self.stages]
+        return f"Startup timing: {' '.join(parts)} total={total:.3f}s"
+
+startup_timer = StartupTimer()
+startup_timer.record("imports", time.perf_counter() - _IMPORT_STARTED)
+
+def _open_stream(client, options: Dict, messages: List[Dict]) -> Tuple[object, List]:
+    """Start a streamed completion and read it up to the first content chunk"""
+    stream = client.chat.completions.create(
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+        **options
+    )
+    opened = []
+    try:
+        for chunk in stream:
+            opened.append(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                break
+    except BaseException:
+        stream.close()
+        raise
+    return stream, opened
+
+async def _aopen_stream(client, options: Dict, messages: List[Dict]) -> Tuple[object, List]:
+    """Async counterpart of _open_stream; closes the stream if cancelled while waiting"""
+    stream = await client.chat.completions.create(
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+        **options
+    )
+    opened = []
+    try:
+        async for chunk in stream:
+            opened.append(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                break
+    except BaseException:
+        await stream.close()
+        raise
+    return stream, opened
+
+def _close_held_stream(result: Tuple[Tuple[object, List], HeldSlot]):
+    """Close a stream opened with a held limiter slot and give the slot back"""
+    (stream, _), slot = result
+    try:
+        stream.close()
+    finally:
+        slot.release()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+async def _aclose_held_stream(result: Tuple[Tuple[object, List], HeldSlot]):
+    (stream, _), slot = result
+    try:
+        await stream.close()
+    finally:
+        slot.release()
 
-# Load environment variables
-load_dotenv(override=True)
+async def _aprepend(items: List, stream) -> AsyncIterator:
+    for item in items:
+        yield item
+    async for item in stream:
+        yield item
+
+def _with_timeout(start: Callable, client, options: Dict, timeout: httpx.Timeout):
+    return start(client, {**options, "timeout": timeout})
+
+def _discard_result(discard: Callable, future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        discard(future.result())
+    except Exception as e:
+        logger.warning(f"Failed to release a losing hedge result: {e}")
 
 class Evaluation(BaseModel):
     is_acceptable: bool
     feedback: str
 
 class PersonalChatbot:
-    def __init__(self, name: str = "Md. Morshed Jamal"):
+    def __init__(self, name: str = "Md. Morshed Jamal", settings: Optional[Settings] = None,
+                 stream: Optional[bool] = None, rejection_policy: Optional[str] = None,
+                 use_async: Optional[bool] = None, background_evaluation: Optional[bool] = None):
         self.name = name
+        self.settings = settings or Settings.load()
+        self.stream = self.settings.stream_responses if stream is None else stream
+        self.rejection_policy = rejection_policy or self.settings.stream_rejection_policy
+        if self.rejection_policy not in STREAM_REJECTION_POLICIES:
+            raise ValueError(
+                f"Unknown STREAM_REJECTION_POLICY '{self.rejection_policy}', "
+                f"expected one of {', '.join(STREAM_REJECTION_POLICIES)}"
+            )
+        self.use_async = self.settings.async_handlers if use_async is None else use_async
+        self.background_evaluation = (
+            self.settings.background_evaluation if background_evaluation is None else background_evaluation
+        )
         self.openai_client = None
         self.gemini_client = None
-        self.linkedin_content = ""
-        self.summary_content = ""
-        self.system_prompt = ""
-        self.evaluator_system_prompt = ""
+        self.async_openai_client = None
+        self.async_gemini_client = None
+        self.hedge_client = None
+        self.async_hedge_client = None
+        self._profile = ProfileContext()
+        self.answer_bank: Optional[AnswerBank] = None
+        self._reload_lock = threading.Lock()
+        self.response_cache = ResponseCache(self.settings.response_cache_size, self.settings.response_cache_ttl)
+        self.near_duplicates = NearDuplicateCache(
+            self.settings.near_duplicate_cache_size,
+            self.settings.response_cache_ttl,
+            self.settings.near_duplicate_threshold,
+        )
+        self._audit_executor = (
+            ThreadPoolExecutor(max_workers=NEAR_DUPLICATE_AUDIT_WORKERS, thread_name_prefix="audit")
+            if self.settings.near_duplicate_cache_size and self.settings.near_duplicate_audit_rate else None
+        )
+        self._audit_rng = random.Random()
+        self.evaluation_policy = EvaluationPolicy(
+            self.settings.evaluation_policy,
+            self.settings.evaluation_sample_rate,
+            self.settings.evaluation_skip_on_cache_hit,
+        )
+        self._review_executor = (
+            ThreadPoolExecutor(max_workers=self.settings.background_evaluation_workers, thread_name_prefix="review")
+            if self.background_evaluation else None
+        )
+        self._background_tasks = set()
+        self.history_summaries = HistorySummaries()
+        self._summary_executor = (
+            ThreadPoolExecutor(max_workers=HISTORY_SUMMARY_WORKERS, thread_name_prefix="summarize")
+            if self.settings.history_summary_threshold else None
+        )
+        self._inflight = SingleFlight()
+        self._ainflight = AsyncSingleFlight()
+        self._stream_inflight = StreamSingleFlight()
+        self._astream_inflight = AsyncStreamSingleFlight()
+        self.hedge_delay = HedgeDelay(
+            self.settings.hedge_percentile,
+            self.settings.hedge_initial_delay,
+            self.settings.hedge_min_delay,
+            self.settings.hedge_max_delay,
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {
+            stage: CircuitBreaker(
+                stage,
+                stage_settings.slow_call_seconds,
+                self.settings.circuit_failure_rate,
+                self.settings.circuit_window,
+                self.settings.circuit_min_calls,
+                self.settings.circuit_open_seconds,
+            )
+            for stage, stage_settings in (
+                ("generation", self.settings.generation),
+                ("evaluation", self.settings.evaluation),
+                ("hedge_generation", self.settings.hedge_generation),
+            )
+            if stage_settings is not None
+        }
+        self.limiters: Dict[str, UpstreamLimiter] = {
+            stage: UpstreamLimiter(
+                stage,
+                getattr(self.settings, stage).max_concurrency,
+                getattr(self.settings, stage).requests_per_minute,
+                getattr(self.settings, stage).burst,
+                self.settings.admission_queue_size,
+                self.settings.admission_max_wait,
+            )
+            for stage in self.breakers
+        }
+        self.retry_policies: Dict[str, RetryPolicy] = {
+            stage: RetryPolicy(
+                stage,
+                getattr(self.settings, stage).max_retries,
+                getattr(self.settings, stage).retry_base_delay,
+                getattr(self.settings, stage).retry_max_delay,
+                self.settings.request_deadline_seconds,
+            )
+            for stage in self.breakers
+        }
+        self._hedge_executor = (
+            ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+            if self.settings.hedge_generation and not self.use_async else None
+        )
+        metrics.set_collector("response_cache", self._collect_cache_metrics)
+        metrics.set_collector("near_duplicates", self._collect_near_duplicate_metrics)
+        metrics.set_collector("hedge", self._collect_hedge_metrics)
+        metrics.set_collector("circuits", self._collect_circuit_metrics)
+        metrics.set_collector("admission", self._collect_admission_metrics)
+        
+        with startup_timer.stage("clients"):
+            self._initialize_clients()
+        with startup_timer.stage("profile"):
+            summary, linkedin = self._load_profile_data()
+        with startup_timer.stage("prompts"):
+            self._profile = self._build_profile_context(summary, linkedin)
+        self.answer_bank = self._load_answer_bank()
         
-        self._initialize_clients()
-        self._load_profile_data()
-        self._create_prompts()
+        self.profile_watcher = None
+        if self.settings.profile_reload_interval:
+            self.profile_watcher = ProfileWatcher(
+                [self.settings.summary_path, self.settings.linkedin_pdf_path, self.settings.answer_bank_path],
+                self._reload_sources,
+                self.settings.profile_reload_interval,
+            )
+            self.profile_watcher.start()
     
     def _initialize_clients(self):
         """Initialize OpenAI and Gemini clients with error handling"""
@@ -39,9 +2172,14 @@ class PersonalChatbot:
             if not openai_api_key:
                 raise ValueError("OPENAI_API_KEY not found in environment variables")
             
+            generation = self.settings.generation
+            evaluation = self.settings.evaluation
+            
             self.openai_client = OpenAI(
-                base_url="https://openrouter.ai/api/v1", 
-                api_key=openai_api_key
+                base_url=generation.base_url, 
+                api_key=openai_api_key,
+                timeout=generation.timeout(),
+                max_retries=0
             )
             
             google_api_key = os.getenv("GOOGLE_API_KEY")
@@ -50,47 +2188,220 @@ class PersonalChatbot:
             
             self.gemini_client = OpenAI(
                 api_key=google_api_key,
-                base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
+                base_url=evaluation.base_url,
+                timeout=evaluation.timeout(),
+                max_retries=0
             )
             
-            logger.info("API clients initialized successfully")
+            if self.use_async:
+                # Shared across all conversations; the underlying httpx pool multiplexes requests
+                self.async_openai_client = AsyncOpenAI(
+                    base_url=generation.base_url,
+                    api_key=openai_api_key,
+                    timeout=generation.timeout(),
+                    max_retries=0
+                )
+                self.async_gemini_client = AsyncOpenAI(
+                    api_key=google_api_key,
+                    base_url=evaluation.base_url,
+                    timeout=evaluation.timeout(),
+                    max_retries=0
+                )
+            
+            hedge = self.settings.hedge_generation
+            if hedge:
+                # The secondary route may live on another provider with its own key
+                hedge_api_key = os.getenv("HEDGE_API_KEY") or openai_api_key
+                if self.use_async:
+                    self.async_hedge_client = AsyncOpenAI(
+                        base_url=hedge.base_url,
+                        api_key=hedge_api_key,
+                        timeout=hedge.timeout(),
+                        max_retries=0
+                    )
+                else:
+                    self.hedge_client = OpenAI(
+                        base_url=hedge.base_url,
+                        api_key=hedge_api_key,
+                        timeout=hedge.timeout(),
+                        max_retries=0
+                    )
+                logger.info(f"Hedged generation enabled via {hedge.model} @ {hedge.base_url}")
+            
+            logger.info(
+                f"API clients initialized successfully (generation: {generation.model} @ {generation.base_url}, "
+                f"evaluation: {evaluation.model} @ {evaluation.base_url})"
+            )
             
         except Exception as e:
             logger.error(f"Failed to initialize API clients: {e}")
             raise
     
-    def _load_profile_data(self):
-        """Load LinkedIn PDF and summary text with error handling"""
+    def _load_profile_data(self) -> Tuple[str, str]:
+        """Load summary text and LinkedIn PDF text with error handling"""
+        summary_content = ""
+        linkedin_content = ""
         try:
             # Load LinkedIn PDF
-            pdf_path = "me/linkedin.pdf"
+            pdf_path = self.settings.linkedin_pdf_path
             if os.path.exists(pdf_path):
-                reader = PdfReader(pdf_path)
-                linkedin_parts = []
-                for page in reader.pages:
-                    text = page.extract_text()
-                    if text:
-                        linkedin_parts.append(text)
-                self.linkedin_content = "\n".join(linkedin_parts)
-                logger.info(f"LinkedIn PDF loaded: {len(self.linkedin_content)} characters")
+                linkedin_content = self._extract_pdf_text(pdf_path)
+                logger.info(f"LinkedIn PDF loaded: {len(linkedin_content)} characters")
             else:
                 logger.warning(f"LinkedIn PDF not found at {pdf_path}")
             
             # Load summary text
-            summary_path = "me/summary.txt"
+            summary_path = self.settings.summary_path
             if os.path.exists(summary_path):
                 with open(summary_path, "r", encoding="utf-8") as f:
-                    self.summary_content = f.read().strip()
-                logger.info(f"Summary loaded: {len(self.summary_content)} characters")
+                    summary_content = f.read().strip()
+                logger.info(f"Summary loaded: {len(summary_content)} characters")
             else:
                 logger.warning(f"Summary file not found at {summary_path}")
                 
         except Exception as e:
             logger.error(f"Failed to load profile data: {e}")
             # Continue with empty content rather than crashing
+        
+        return summary_content, linkedin_content
     
-    def _create_prompts(self):
-        """Create system prompts for chat and evaluation"""
+    def _extract_pdf_text(self, pdf_path: str) -> str:
+        """Extract text from a PDF, reusing the on-disk extraction cache when possible"""
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+        
+        options = self.settings.pdf_extraction_options
+        key = _extraction_cache_key(pdf_bytes, options)
+        name = os.path.splitext(os.path.basename(pdf_path))[0]
+        cache_path = os.path.join(self.settings.profile_cache_dir, f"{name}-{key}.json")
+        
+        cached = _read_extraction_cache(cache_path)
+        if cached is not None:
+            logger.info(f"Using cached extraction for {pdf_path}")
+            return cached
+        
+        pages = extract_pages(
+            pdf_bytes, options, self.settings.pdf_extraction_workers, self.settings.pdf_parallel_min_pages, pdf_path
+        )
+        linkedin_parts = [text for text in pages if text]
+        content = "\n".join(linkedin_parts)
+        
+        try:
+            _write_extraction_cache(cache_path, pdf_path, content, options)
+        except Exception as e:
+            # The cache is an optimisation; a read-only filesystem shouldn't stop startup
+            logger.warning(f"Failed to write extraction cache for {pdf_path}: {e}")
+        
+        return content
+    
+    def _build_profile_context(self, summary: str, linkedin: str) -> ProfileContext:
+        """Bundle profile text into the shared context, indexing long profiles for retrieval"""
+        settings = self.settings
+        index = None
+        if len(summary) + len(linkedin) >= settings.retrieval_min_profile_chars:
+            chunks = (
+                _chunk_text(summary, "Summary", settings.retrieval_chunk_chars)
+                + _chunk_text(linkedin, "LinkedIn Profile", settings.retrieval_chunk_chars)
+            )
+            index = ProfileIndex(chunks)
+            logger.info(f"Profile retrieval enabled: {len(chunks)} chunks, top {settings.retrieval_top_k} per question")
+        block = ""
+        if index is None:
+            sections = [("Summary", summary), ("LinkedIn Profile", linkedin)]
+            block = "\n\n".join(f"## {section}:\n{text}" for section, text in sections if text)
+        system_prompt = self._render_system_prompt()
+        evaluator_prompt = self._render_evaluator_prompt()
+        version = _fingerprint(summary + "\0" + linkedin)[:12]
+        return ProfileContext(
+            block=block,
+            has_summary=bool(summary),
+            has_linkedin=bool(linkedin),
+            version=version,
+            index=index,
+            system_prompt=system_prompt,
+            evaluator_prompt=evaluator_prompt,
+            # The version covers retrieval mode, where the profile is out of the (empty) block
+            prompt_fingerprint=_fingerprint(version + "\0" + system_prompt + "\0" + evaluator_prompt + "\0" + block),
+        )
+    
+    @property
+    def profile(self) -> ProfileContext:
+        """Profile snapshot for the current request, pinned on first use; the live one outside requests"""
+        trace = _current_trace.get()
+        if trace is None:
+            return self._profile
+        if trace.profile is None:
+            trace.profile = self._profile
+        return trace.profile
+    
+    def _load_answer_bank(self) -> Optional[AnswerBank]:
+        """Load the precomputed answer bank, if present and built from the current profile"""
+        try:
+            bank = AnswerBank.load(self.settings.answer_bank_path, self.settings.answer_bank_min_similarity)
+        except Exception as e:
+            logger.error(f"Failed to load answer bank: {e}")
+            return None
+        if bank is None:
+            return None
+        if bank.profile_version != self._profile.version:
+            logger.warning(
+                f"Answer bank at {self.settings.answer_bank_path} was built for profile {bank.profile_version}, "
+                f"current is {self._profile.version}; rebuild it with build_answer_bank.py"
+            )
+        else:
+            logger.info(f"Answer bank loaded: {len(bank)} answers")
+        return bank
+    
+    def _reload_sources(self):
+        self.reload_profile()
+        self.answer_bank = self._load_answer_bank()
+    
+    def reload_profile(self) -> bool:
+        """Re-read the profile sources and swap in a new snapshot if their content changed
+        
+        The new context, retrieval index included, is fully built before a single reference
+        assignment publishes it; requests already under way keep the snapshot they pinned.
+        """
+        with self._reload_lock:
+            current = self._profile
+            summary, linkedin = self._load_profile_data()
+            if (current.has_summary and not summary) or (current.has_linkedin and not linkedin):
+                # Likely caught mid-replace; the next change will trigger another reload
+                logger.warning("Profile source missing or empty, keeping the current profile")
+                return False
+            
+            profile = self._build_profile_context(summary, linkedin)
+            if profile.version == current.version:
+                return False
+            
+            self._profile = profile
+            # Cached replies were vetted against the old profile
+            self.response_cache.clear()
+            self.near_duplicates.clear()
+            metrics.inc("chatbot_profile_reloads_total", help="Profile snapshots swapped in by hot reload")
+            logger.info(f"Profile reloaded: version {current.version} -> {profile.version}")
+            return True
+    
+    # Both prompts are rendered once per profile snapshot and read from it, which keeps them
+    # byte-identical across calls for upstream prefix caches.
+    @property
+    def system_prompt(self) -> str:
+        return self.profile.system_prompt
+    
+    @property
+    def evaluator_system_prompt(self) -> str:
+        return self.profile.evaluator_prompt
+    
+    def _profile_messages(self, prompt: str) -> List[Dict]:
+        """Leading system messages: the instruction prompt, then the shared profile block if it is sent whole"""
+        messages = [{"role": "system", "content": prompt}]
+        block = self.profile.block
+        if block:
+            messages.append({"role": "system", "content": block})
+        return messages
+    
+    def _render_system_prompt(self) -> str:
+        """Render the chat instructions that precede the profile block"""
         base_prompt = (
             f"You are acting as {self.name}. You are answering questions on {self.name}'s website, "
             f"particularly questions related to {self.name}'s career, background, skills and experience. "
@@ -100,30 +2411,33 @@ class PersonalChatbot:
             f"If you don't know the answer, say so politely and suggest they contact {self.name} directly."
         )
         
-        if self.summary_content:
-            base_prompt += f"\n\n## Summary:\n{self.summary_content}"
-        
-        if self.linkedin_content:
-            base_prompt += f"\n\n## LinkedIn Profile:\n{self.linkedin_content}"
-        
-        self.system_prompt = base_prompt + f"\n\nWith this context, please chat with the user, always staying in character as {self.name}."
-        
-        # Evaluator prompt
+        return base_prompt + f"\n\nUsing the context you are given, please chat with the user, always staying in character as {self.name}."
+    
+    def _render_evaluator_prompt(self) -> str:
+        """Render the evaluator instructions that precede the profile block"""
         evaluator_base = (
             f"You are an evaluator that decides whether a response to a question is acceptable quality. "
             f"You are provided with a conversation between a User and an Agent. Your task is to decide whether the Agent's latest response is acceptable. "
             f"The Agent is playing the role of {self.name} and is representing {self.name} on their website. "
             f"The Agent has been instructed to be professional and engaging, as if talking to a potential client or future employer. "
-            f"The Agent has been provided with context on {self.name}. Here's the information:"
+            f"The Agent has been provided with context on {self.name}."
         )
         
-        if self.summary_content:
-            evaluator_base += f"\n\n## Summary:\n{self.summary_content}"
-        
-        if self.linkedin_content:
-            evaluator_base += f"\n\n## LinkedIn Profile:\n{self.linkedin_content}"
-        
-        self.evaluator_system_prompt = evaluator_base + f"\n\nWith this context, please evaluate the latest response, replying with whether the response is acceptable and your feedback."
+        return evaluator_base + f"\n\nUsing that context, which follows, please evaluate the latest response, replying with whether the response is acceptable and your feedback."
+    
+    def _retrieved_profile_block(self, message: str, index: ProfileIndex) -> str:
+        """Profile context made of the chunks most relevant to a message"""
+        sections: Dict[str, List[str]] = {}
+        for section, text in index.search(message, self.settings.retrieval_top_k):
+            sections.setdefault(section, []).append(text)
+        return "".join(f"\n\n## {section} (relevant excerpts):\n" + "\n...\n".join(texts) for section, texts in sections.items())
+    
+    def _profile_excerpts(self, message: str) -> str:
+        """Retrieved profile context for a message; empty when the whole profile is in the static prompts"""
+        index = self.profile.index
+        if index is None:
+            return ""
+        return self._retrieved_profile_block(message, index).strip()
     
     def _format_conversation_history(self, history: List[Dict]) -> str:
         """Format conversation history for evaluation"""
@@ -138,114 +2452,1099 @@ class PersonalChatbot:
         
         return "\n\n".join(formatted)
     
-    def _generate_response(self, message: str, history: List[Dict], system_prompt: str, model: str = "tngtech/deepseek-r1t2-chimera:free") -> str:
+    def _generation_options(self, model: Optional[str] = None) -> Dict:
+        """Model parameters for generation calls, optionally overriding the model"""
+        options = self.settings.generation.completion_options()
+        if model:
+            options["model"] = model
+        return options
+    
+    def _generation_targets(self, model: Optional[str] = None,
+                            use_async: bool = False) -> List[Tuple[str, object, Dict, CircuitBreaker]]:
+        """(label, client, options, breaker) for the primary generation route and the hedge, if configured"""
+        targets = [(
+            "primary",
+            self.async_openai_client if use_async else self.openai_client,
+            self._generation_options(model),
+            self.breakers["generation"],
+        )]
+        hedge_client = self.async_hedge_client if use_async else self.hedge_client
+        if hedge_client is not None:
+            targets.append((
+                "hedge",
+                hedge_client,
+                self.settings.hedge_generation.completion_options(),
+                self.breakers["hedge_generation"],
+            ))
+        return targets
+    
+    def _call_upstream(self, endpoint: str, fn: Callable, hold: bool = False):
+        """Call an endpoint through its retry policy; each attempt is admitted by the limiter, then the breaker
+        
+        The breaker sits inside so time spent queueing doesn't count as upstream slowness, and
+        every attempt, retries included, counts against the rate limit and the breaker's window.
+        With hold, the call returns (result, HeldSlot) and its concurrency slot stays taken until
+        the caller releases it, for results such as streams that keep using the upstream.
+        fn(timeout) performs the call with a timeout worked out once the attempt is admitted. If
+        the request's budget cut that timeout well short of the stage's and it fires, the attempt
+        fails with DeadlineExceededError. The retry policy doesn't retry it, and the breaker only
+        counts it against the endpoint if the call had already run past slow_call_seconds.
+        """
+        limiter, breaker = self.limiters[endpoint], self.breakers[endpoint]
+        read_timeout = getattr(self.settings, endpoint).read_timeout
+        attempt = functools.partial(
+            limiter.call, lambda: breaker.call(
+                functools.partial(_call_within_deadline, fn, self._upstream_timeout(endpoint), read_timeout)
+            ), hold
+        )
+        return self.retry_policies[endpoint].call(attempt)
+    
+    async def _acall_upstream(self, endpoint: str, fn: Callable, hold: bool = False):
+        limiter, breaker = self.limiters[endpoint], self.breakers[endpoint]
+        read_timeout = getattr(self.settings, endpoint).read_timeout
+        attempt = functools.partial(
+            limiter.acall, lambda: breaker.acall(
+                functools.partial(_acall_within_deadline, fn, self._upstream_timeout(endpoint), read_timeout)
+            ), hold
+        )
+        return await self.retry_policies[endpoint].acall(attempt)
+    
+    def _upstream_timeout(self, endpoint: str) -> httpx.Timeout:
+        """The stage's timeouts, cut down to what is left of the request's budget
+        
+        httpx applies them per connection wait (connect, each read), so a streamed call can
+        outlast them in total; the stages after it still see the real remaining budget.
+        """
+        stage = getattr(self.settings, endpoint)
+        deadline = _current_deadline()
+        if deadline is None:
+            return stage.timeout()
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"Request deadline passed before calling {endpoint}")
+        return httpx.Timeout(min(stage.read_timeout, remaining), connect=min(stage.connect_timeout, remaining))
+    
+    def _within_budget(self, stage: str, endpoint: str) -> bool:
+        """Whether enough of the request's time budget is left for an optional stage"""
+        deadline = _current_deadline()
+        if deadline is None:
+            return True
+        remaining = deadline.remaining()
+        if remaining > 0 and remaining >= getattr(self.settings, endpoint).min_budget_seconds:
+            return True
+        logger.info(f"Skipping {stage}: {remaining:.1f}s of the request budget left")
+        metrics.inc("chatbot_deadline_skips_total", help="Optional stages skipped to stay within the request deadline",
+                    stage=stage)
+        _current_trace.get().budget_skips.append(stage)
+        return False
+    
+    def _generation_attempts(self, start: Callable, model: Optional[str] = None,
+                             use_async: bool = False, hold: bool = False) -> List[Tuple[str, Callable]]:
+        """Race candidates for a generation call, routing around endpoints whose circuit is open
+        
+        start(client, options) performs the call; each attempt runs it through the endpoint's limiter and breaker,
+        holding the limiter slot past the call if hold is set.
+        """
+        attempts = []
+        for label, client, options, breaker in self._generation_targets(model, use_async):
+            if breaker.available():
+                guarded = self._acall_upstream if use_async else self._call_upstream
+                attempts.append((label, functools.partial(
+                    guarded, breaker.name, functools.partial(_with_timeout, start, client, options), hold
+                )))
+        if not attempts:
+            metrics.inc("chatbot_circuit_rejections_total", help="Calls failed fast by an open circuit", endpoint="generation")
+            raise CircuitOpenError("All generation circuits are open")
+        return attempts
+    
+    def _note_hedge(self, stage: str, winner: str):
+        metrics.inc("chatbot_hedged_requests_total", help="Generation calls that fired a hedge request",
+                    stage=stage, winner=winner)
+        _note_trace(hedged=winner)
+    
+    def _race_hedged(self, attempts: List[Tuple[str, Callable]], stage: str,
+                     discard: Optional[Callable] = None) -> Tuple[str, object]:
+        """Run the primary attempt, racing the hedge against it once it stalls past the adaptive delay
+        
+        Returns (label, result) of the first attempt to succeed. Losing results are passed to
+        discard; a losing call that is already in flight cannot be interrupted, only ignored.
+        """
+        primary_label, primary = attempts[0]
+        if len(attempts) == 1:
+            return primary_label, primary()
+        
+        started = time.perf_counter()
+        pending = {self._hedge_executor.submit(contextvars.copy_context().run, primary): primary_label}
+        done, _ = wait(pending, timeout=self.hedge_delay.current())
+        hedged = not done or next(iter(done)).exception() is not None
+        if hedged:
+            hedge_label, hedge = attempts[1]
+            pending[self._hedge_executor.submit(contextvars.copy_context().run, hedge)] = hedge_label
+        
+        error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                label = pending.pop(future)
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if label == primary_label or primary_label in pending.values():
+                    # A losing primary still tells us it was at least this slow
+                    self.hedge_delay.observe(time.perf_counter() - started)
+                for loser in pending:
+                    loser.cancel()
+                    if discard is not None:
+                        loser.add_done_callback(functools.partial(_discard_result, discard))
+                if hedged:
+                    self._note_hedge(stage, label)
+                return label, future.result()
+        raise error
+    
+    async def _arace_hedged(self, attempts: List[Tuple[str, Callable]], stage: str,
+                            discard: Optional[Callable] = None) -> Tuple[str, object]:
+        """Async counterpart of _race_hedged; the losing call is cancelled outright"""
+        primary_label, primary = attempts[0]
+        if len(attempts) == 1:
+            return primary_label, await primary()
+        
+        started = time.perf_counter()
+        pending = {asyncio.ensure_future(primary()): primary_label}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay.current())
+            hedged = not done or next(iter(done)).exception() is not None
+            if hedged:
+                hedge_label, hedge = attempts[1]
+                pending[asyncio.ensure_future(hedge())] = hedge_label
+            
+            error = None
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    label = pending.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if label == primary_label or primary_label in pending.values():
+                        self.hedge_delay.observe(time.perf_counter() - started)
+                    if discard is not None:
+                        for loser in pending:
+                            loser.add_done_callback(functools.partial(self._adiscard_result, discard))
+                    if hedged:
+                        self._note_hedge(stage, label)
+                    return label, task.result()
+            raise error
+        finally:
+            for loser in pending:
+                loser.cancel()
+    
+    def _adiscard_result(self, discard: Callable, task: asyncio.Future):
+        if task.cancelled() or task.exception() is not None:
+            return
+        closing = asyncio.ensure_future(discard(task.result()))
+        self._background_tasks.add(closing)
+        closing.add_done_callback(self._background_tasks.discard)
+    
+    def _budget_history(self, history: List[Dict], stage: str, budget: int, fixed: List[str],
+                        reserved: int = 0) -> Tuple[List[Dict], int]:
+        """Trim history to what is left of a stage's token budget after the fixed prompt parts"""
+        used = reserved + sum(_estimate_tokens(text) + MESSAGE_TOKEN_OVERHEAD for text in fixed)
+        kept, dropped = _trim_history(history, budget - used)
+        if kept != history:
+            metrics.inc("chatbot_history_trimmed_total", help="Prompts whose conversation history was trimmed to budget",
+                        stage=stage)
+            metrics.inc("chatbot_history_dropped_messages_total", dropped,
+                        help="History messages left out of prompts to stay within budget", stage=stage)
+        return kept, dropped
+    
+    def _condense_history(self, history: List[Dict]) -> Tuple[Optional[str], List[Dict]]:
+        """Replace older turns with their running summary, if one is ready
+        
+        Never waits: a missing or stale summary is scheduled in the background and this turn
+        falls back to the raw messages, which the token budget then trims.
+        """
+        settings = self.settings
+        if not settings.history_summary_threshold or len(history) <= settings.history_summary_threshold:
+            return None, history
+        
+        digests = _prefix_digests(history[:len(history) - settings.history_summary_keep_recent])
+        covered, summary = self.history_summaries.latest(digests)
+        if covered < len(digests):
+            self._schedule_summary(history, digests, covered, summary)
+        if summary is None:
+            return None, history
+        return summary, history[covered:]
+    
+    def _schedule_summary(self, history: List[Dict], digests: List[str], covered: int, summary: Optional[str]):
+        """Fold the next batch of aged-out messages into the running summary off the request path"""
+        # Catch up in budget-sized steps so a long restored session doesn't need one huge call
+        remaining = self.settings.evaluation.prompt_token_budget - _estimate_tokens(summary or "")
+        end = covered
+        while end < len(digests):
+            cost = _estimate_tokens(str(history[end].get("content", ""))) + MESSAGE_TOKEN_OVERHEAD
+            if end > covered and cost > remaining:
+                break
+            remaining -= cost
+            end += 1
+        if not self.history_summaries.claim(digests[end - 1]):
+            return
+        self._summary_executor.submit(self._summarize, digests[end - 1], summary, history[covered:end])
+    
+    def _summarize(self, digest: str, summary: Optional[str], messages: List[Dict]):
+        """Compute and cache a running summary; runs on the summary executor"""
+        try:
+            prompt = (
+                f"Current summary:\n{summary or 'None yet.'}\n\n"
+                f"New messages:\n{self._format_conversation_history(messages)}\n\n"
+                f"Return the updated summary only."
+            )
+            with _timed_stage("summarize"):
+                response = self._call_upstream("evaluation", lambda timeout: self.gemini_client.chat.completions.create(
+                    model=self.settings.evaluation.model,
+                    messages=[
+                        {"role": "system", "content": self._summary_system_prompt()},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=self.settings.history_summary_max_tokens,
+                    timeout=timeout
+                ))
+            _record_usage("summarize", getattr(response, "usage", None))
+            
+            updated = (response.choices[0].message.content or "").strip()
+            if not updated:
+                raise ValueError("empty summary")
+            self.history_summaries.store(digest, updated)
+            metrics.inc("chatbot_history_summaries_total", help="Running conversation summaries computed",
+                        outcome="stored")
+            
+        except Exception as e:
+            logger.error(f"Failed to summarize conversation history: {e}")
+            self.history_summaries.release(digest)
+            metrics.inc("chatbot_history_summaries_total", help="Running conversation summaries computed",
+                        outcome="failed")
+    
+    def _summary_system_prompt(self) -> str:
+        return (
+            f"You maintain a running summary of a conversation between a visitor and an agent representing {self.name}. "
+            f"Fold the new messages into the current summary. Keep who the visitor is (name, company, role), "
+            f"what they are looking for, the questions already answered and anything the agent offered or promised. "
+            f"Drop pleasantries. Write in the third person and stay under "
+            f"{self.settings.history_summary_max_tokens * 3 // 4} words."
+        )
+    
+    def _build_messages(self, message: str, history: List[Dict], instructions: str = "") -> List[Dict]:
+        """Assemble the chat completion messages for a turn
+        
+        Layout, from most to least reusable across calls: the static system prompt, the running
+        summary, the most recent history that fits the budget, the new message, and finally any
+        per-request instructions, so upstream prefix caches match as much as possible.
+        """
+        summary, history = self._condense_history(history)
+        head = self._profile_messages(self.system_prompt)
+        if summary:
+            head.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        history, _ = self._budget_history(
+            history, "generation", self.settings.generation.prompt_token_budget,
+            [msg["content"] for msg in head] + [message, instructions]
+        )
+        messages = head + history + [{"role": "user", "content": message}]
+        if instructions:
+            messages.append({"role": "system", "content": instructions})
+        return messages
+    
+    def _generate_response(self, message: str, history: List[Dict], instructions: str, model: Optional[str] = None,
+                           stage: str = "generate") -> str:
         """Generate response using OpenAI client"""
         try:
-            messages = [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": message}]
+            messages = self._build_messages(message, history, instructions)
             
-            response = self.openai_client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000
+            attempts = self._generation_attempts(
+                lambda client, options: client.chat.completions.create(messages=messages, **options), model
             )
+            with _timed_stage(stage):
+                _, response = self._race_hedged(attempts, stage)
+            _record_usage(stage, getattr(response, "usage", None))
             
             return response.choices[0].message.content
             
+        except UpstreamBusyError:
+            raise
         except Exception as e:
             logger.error(f"Failed to generate response: {e}")
-            return f"I apologize, but I'm experiencing technical difficulties. Please try again later or contact {self.name} directly."
+            return self._apology_message()
     
-    def evaluate_response(self, reply: str, message: str, history: List[Dict]) -> Evaluation:
-        """Evaluate response quality using Gemini"""
+    def _stream_response(self, message: str, history: List[Dict], instructions: str, model: Optional[str] = None,
+                         stage: str = "generate") -> Iterator[str]:
+        """Stream a response using OpenAI client, yielding the accumulated text"""
+        reply = ""
         try:
-            conversation_history = self._format_conversation_history(history)
+            messages = self._build_messages(message, history, instructions)
             
-            user_prompt = (
-                f"Here's the conversation between the User and the Agent:\n\n{conversation_history}\n\n"
-                f"Here's the latest message from the User:\n\n{message}\n\n"
-                f"Here's the latest response from the Agent:\n\n{reply}\n\n"
-                f"Please evaluate the response, replying with whether it is acceptable and your feedback."
-            )
+            # The stream keeps its limiter slot until it is drained or closed
+            attempts = self._generation_attempts(functools.partial(_open_stream, messages=messages), model, hold=True)
             
-            messages = [
-                {"role": "system", "content": self.evaluator_system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
+            with _timed_stage(stage):
+                started = time.perf_counter()
+                _, held = self._race_hedged(attempts, stage, discard=_close_held_stream)
+                (stream, opened), _ = held
+                try:
+                    for chunk in itertools.chain(opened, stream):
+                        _record_usage(stage, getattr(chunk, "usage", None))
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if not reply:
+                                metrics.observe("chatbot_time_to_first_token_seconds", time.perf_counter() - started,
+                                                help="Time until the first streamed token", stage=stage)
+                            reply += delta
+                            yield reply
+                finally:
+                    _close_held_stream(held)
             
-            response = self.gemini_client.beta.chat.completions.parse(
-                model="gemini-2.5-flash",
-                messages=messages,
-                response_format=Evaluation
-            )
+        except UpstreamBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to stream response: {e}")
+            if reply:
+                # Keep what the visitor has already seen rather than wiping it
+                return
+        
+        if not reply:
+            yield self._apology_message()
+    
+    def _build_evaluation_messages(self, reply: str, message: str, history: List[Dict]) -> List[Dict]:
+        """Assemble the evaluator messages for a reply, within the evaluator's token budget"""
+        excerpts = self._profile_excerpts(message)
+        summary, history = self._condense_history(history)
+        history, dropped = self._budget_history(
+            history, "evaluation", self.settings.evaluation.prompt_token_budget,
+            [self.evaluator_system_prompt, self.profile.block, excerpts, message, reply, summary or ""],
+            EVALUATION_PROMPT_OVERHEAD_TOKENS
+        )
+        conversation_history = self._format_conversation_history(history)
+        if dropped:
+            conversation_history = f"({dropped} earlier messages omitted)\n\n{conversation_history}"
+        if summary:
+            conversation_history = f"Summary of the earlier conversation:\n{summary}\n\n{conversation_history}"
+        
+        user_prompt = (
+            (f"Here's the context on {self.name} the Agent was given for this question:\n\n{excerpts}\n\n" if excerpts else "") +
+            f"Here's the conversation between the User and the Agent:\n\n{conversation_history}\n\n"
+            f"Here's the latest message from the User:\n\n{message}\n\n"
+            f"Here's the latest response from the Agent:\n\n{reply}\n\n"
+            f"Please evaluate the response, replying with whether it is acceptable and your feedback."
+        )
+        
+        return self._profile_messages(self.evaluator_system_prompt) + [{"role": "user", "content": user_prompt}]
+    
+    def evaluate_response(self, reply: str, message: str, history: List[Dict]) -> Evaluation:
+        """Evaluate response quality using Gemini"""
+        try:
+            messages = self._build_evaluation_messages(reply, message, history)
+            
+            with _timed_stage("evaluate"):
+                response = self._call_upstream("evaluation", lambda timeout: self.gemini_client.beta.chat.completions.parse(
+                    messages=messages,
+                    response_format=Evaluation,
+                    timeout=timeout,
+                    **self.settings.evaluation.completion_options()
+                ))
+            _record_usage("evaluate", getattr(response, "usage", None))
             
             return response.choices[0].message.parsed
             
         except Exception as e:
             logger.error(f"Failed to evaluate response: {e}")
             # Return acceptable by default if evaluation fails
-            return Evaluation(is_acceptable=True, feedback="Evaluation service unavailable")
+            return Evaluation(is_acceptable=True, feedback=EVALUATION_UNAVAILABLE)
     
-    def regenerate_response(self, original_reply: str, message: str, history: List[Dict], feedback: str) -> str:
-        """Regenerate response based on feedback"""
-        updated_system_prompt = (
-            self.system_prompt + 
+    def _regeneration_instructions(self, original_reply: str, message: str, feedback: str) -> str:
+        """Build the per-request instructions used to retry a rejected answer"""
+        return (
+            self._request_instructions(message) + 
             "\n\n## Previous answer rejected\n"
             f"You just tried to reply, but the quality control rejected your reply.\n"
             f"## Your attempted answer:\n{original_reply}\n\n"
             f"## Reason for rejection:\n{feedback}\n\n"
             f"Please provide a better response that addresses the feedback."
+        ).strip()
+    
+    def regenerate_response(self, original_reply: str, message: str, history: List[Dict], feedback: str) -> str:
+        """Regenerate response based on feedback"""
+        retry_instructions = self._regeneration_instructions(original_reply, message, feedback)
+        
+        _note_trace(regenerated=True)
+        return self._generate_response(message, history, retry_instructions, stage="regenerate")
+    
+    def _request_instructions(self, message: str) -> str:
+        """Per-request context and special behaviours, sent after the static system prompt"""
+        return (self._profile_excerpts(message) + "\n\n" + self._behaviour_instructions(message)).strip()
+    
+    def _behaviour_instructions(self, message: str) -> str:
+        """Special behaviours triggered by the message itself"""
+        # Special handling for patent questions (pig latin requirement)
+        if "patent" in message.lower():
+            return (
+                "IMPORTANT: Everything in your reply needs to be in pig latin - "
+                "it is mandatory that you respond only and entirely in pig latin."
+            )
+        return ""
+    
+    def _answer_bank_reply(self, message: str, history: List[Dict]) -> Optional[str]:
+        """Precomputed vetted answer for a first-turn question, if the bank has a close enough match"""
+        bank = self.answer_bank
+        if bank is None or history or bank.profile_version != self.profile.version:
+            return None
+        entry = bank.match(message)
+        # A near match must not skip a behaviour the visitor's wording triggers, or vice versa
+        if entry is None or self._behaviour_instructions(entry["question"]) != self._behaviour_instructions(message):
+            metrics.inc("chatbot_answer_bank_total", help="First-turn answer bank lookups", outcome="miss")
+            return None
+        metrics.inc("chatbot_answer_bank_total", help="First-turn answer bank lookups", outcome="hit")
+        logger.info(f"Serving precomputed answer for: {entry['question']}")
+        _note_trace(answer_bank=True)
+        return entry["answer"]
+    
+    def _collect_cache_metrics(self) -> List[Tuple[str, Dict[str, str], float]]:
+        stats = self.response_cache.stats()
+        return [(f"chatbot_response_cache_{field}", {}, value) for field, value in stats.items()]
+    
+    def _collect_near_duplicate_metrics(self) -> List[Tuple[str, Dict[str, str], float]]:
+        stats = self.near_duplicates.stats()
+        return [(f"chatbot_near_duplicate_cache_{field}", {}, value) for field, value in stats.items()]
+    
+    def _collect_hedge_metrics(self) -> List[Tuple[str, Dict[str, str], float]]:
+        if not self.settings.hedge_generation:
+            return []
+        return [("chatbot_hedge_delay_seconds", {}, self.hedge_delay.current())]
+    
+    def _collect_circuit_metrics(self) -> List[Tuple[str, Dict[str, str], float]]:
+        # 0 closed, 1 half-open, 2 open
+        return [
+            ("chatbot_circuit_state", {"endpoint": name}, CircuitBreaker.STATES.index(breaker.state))
+            for name, breaker in self.breakers.items()
+        ]
+    
+    def _collect_admission_metrics(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        for name, limiter in self.limiters.items():
+            samples.append(("chatbot_upstream_in_flight", {"upstream": name}, limiter.active))
+            samples.append(("chatbot_upstream_queued", {"upstream": name}, limiter.queued))
+        return samples
+    
+    def _apology_message(self) -> str:
+        return f"I apologize, but I'm experiencing technical difficulties. Please try again later or contact {self.name} directly."
+    
+    def _busy_message(self) -> str:
+        return "I'm getting a lot of questions right now. Please try again in a few seconds!"
+    
+    def _busy_reply(self, error: UpstreamBusyError) -> str:
+        logger.warning(f"Turning request away: {error}")
+        _note_trace(busy=True)
+        return self._busy_message()
+    
+    def _skip_busy_regeneration(self, error: UpstreamBusyError):
+        """Record a regeneration turned away by admission control; the caller serves the original reply"""
+        logger.warning(f"Skipping regenerate, serving the original reply: {error}")
+        metrics.inc("chatbot_busy_skips_total", help="Optional stages skipped because the upstream was busy",
+                    stage="regenerate")
+        _note_trace(regenerated=False)
+    
+    def _response_cache_key(self, message: str, history: List[Dict], instructions: str, model: str) -> str:
+        """Cache key from the normalized message, conversation so far, prompts and model"""
+        conversation = json.dumps(
+            [[msg.get("role"), msg.get("content")] for msg in history], ensure_ascii=False
+        )
+        return "|".join([
+            _normalize_message(message),
+            _fingerprint(conversation),
+            _fingerprint(self.profile.prompt_fingerprint + "\0" + instructions),
+            model,
+        ])
+    
+    def _cache_vetted_reply(self, key: str, message: str, history: List[Dict], reply: str, evaluation: Evaluation):
+        """Store a reply only if the evaluator actually approved it"""
+        if (evaluation.is_acceptable
+                and evaluation.feedback not in (EVALUATION_UNAVAILABLE, EVALUATION_SKIPPED)
+                and reply != self._apology_message()):
+            self.response_cache.put(key, reply)
+            if not history:
+                self.near_duplicates.put(self._near_duplicate_scope(message), message, reply)
+    
+    def _near_duplicate_scope(self, message: str) -> str:
+        """Partition near-duplicate entries by everything but the question's wording"""
+        return _fingerprint(
+            self.profile.prompt_fingerprint + "\0" + self._behaviour_instructions(message) + "\0" + self.settings.generation.model
         )
+    
+    def _near_duplicate_match(self, message: str, history: List[Dict]) -> Optional[Tuple[Tuple[str, str], str, str, float]]:
+        """Find the vetted reply to a reworded earlier first-turn question"""
+        if history or self.settings.near_duplicate_cache_size <= 0:
+            return None
+        match = self.near_duplicates.get(self._near_duplicate_scope(message), message)
+        metrics.inc("chatbot_near_duplicate_lookups_total", help="First-turn near-duplicate cache lookups",
+                    outcome="miss" if match is None else "hit")
+        return match
+    
+    def _near_duplicate_reply(self, match: Tuple[Tuple[str, str], str, str, float], message: str,
+                              evaluation: Evaluation) -> Optional[str]:
+        """Serve a near-duplicate hit unless the evaluation policy rejected it for this question"""
+        key, question, reply, similarity = match
+        if not evaluation.is_acceptable:
+            logger.warning(f"Near-duplicate of '{question}' rejected for '{message}': {evaluation.feedback}")
+            self.near_duplicates.discard(key)
+            return None
+        
+        logger.info(f"Serving near-duplicate of '{question}' (similarity {similarity:.2f})")
+        _note_trace(cache_hit=True, near_duplicate=True)
+        # Hits the policy already evaluated need no audit
+        if (evaluation.feedback == EVALUATION_SKIPPED and self._audit_executor is not None
+                and self._audit_rng.random() < self.settings.near_duplicate_audit_rate):
+            # Outside the request's context, so the audit's evaluator call isn't billed to this request
+            self._audit_executor.submit(self._audit_near_duplicate, key, question, message, reply)
+        return reply
+    
+    def _audit_near_duplicate(self, key: Tuple[str, str], question: str, message: str, reply: str):
+        """Ask the evaluator whether a reply served for a reworded question really answers it"""
+        evaluation = self.evaluate_response(reply, message, [])
+        if evaluation.feedback == EVALUATION_UNAVAILABLE:
+            outcome = "unavailable"
+        elif evaluation.is_acceptable:
+            outcome = "confirmed"
+        else:
+            outcome = "false_hit"
+            logger.warning(
+                f"Near-duplicate false hit: reply to '{question}' served for '{message}': {evaluation.feedback}"
+            )
+            self.near_duplicates.discard(key)
+        metrics.inc("chatbot_near_duplicate_audits_total", help="Evaluator audits of near-duplicate cache hits",
+                    outcome=outcome)
+    
+    def _log_evaluation(self, reason: str, evaluation: Optional[Evaluation]):
+        """One log line per request with the policy decision and its outcome"""
+        if evaluation is None:
+            outcome = "skipped"
+        else:
+            outcome = "accepted" if evaluation.is_acceptable else "rejected"
+        _note_trace(evaluation=f"{reason}:{outcome}")
+        metrics.inc("chatbot_evaluations_total", help="Evaluation policy decisions and outcomes",
+                    reason=reason, outcome=outcome)
+        logger.info(
+            f"Evaluation policy={self.evaluation_policy.mode} "
+            f"decision={'evaluate' if evaluation else 'skip'} reason={reason} outcome={outcome}"
+        )
+    
+    def _evaluate_with_policy(self, reply: str, message: str, history: List[Dict], cached: bool = False) -> Evaluation:
+        """Evaluate a reply if the evaluation policy asks for it"""
+        should_evaluate, reason = self.evaluation_policy.decide(reply, cached=cached)
+        if should_evaluate and not self._within_budget("evaluate", "evaluation"):
+            should_evaluate, reason = False, "deadline"
+        if not should_evaluate:
+            self._log_evaluation(reason, None)
+            return Evaluation(is_acceptable=True, feedback=EVALUATION_SKIPPED)
         
-        return self._generate_response(message, history, updated_system_prompt, model="tngtech/deepseek-r1t2-chimera:free")
+        evaluation = self.evaluate_response(reply, message, history)
+        self._log_evaluation(reason, evaluation)
+        return evaluation
     
+    async def _aevaluate_with_policy(self, reply: str, message: str, history: List[Dict], cached: bool = False) -> Evaluation:
+        """Async variant of _evaluate_with_policy"""
+        should_evaluate, reason = self.evaluation_policy.decide(reply, cached=cached)
+        if should_evaluate and not self._within_budget("evaluate", "evaluation"):
+            should_evaluate, reason = False, "deadline"
+        if not should_evaluate:
+            self._log_evaluation(reason, None)
+            return Evaluation(is_acceptable=True, feedback=EVALUATION_SKIPPED)
+        
+        evaluation = await self.aevaluate_response(reply, message, history)
+        self._log_evaluation(reason, evaluation)
+        return evaluation
+    
+    def _cached_reply(self, cache_key: str, message: str, history: List[Dict]) -> Optional[str]:
+        """Look up a cached reply, re-evaluating it if the policy requires"""
+        cached = self.response_cache.get(cache_key)
+        if cached is None:
+            match = self._near_duplicate_match(message, history)
+            if match is None:
+                return None
+            return self._near_duplicate_reply(
+                match, message, self._evaluate_with_policy(match[2], message, history, cached=True)
+            )
+        if not self._evaluate_with_policy(cached, message, history, cached=True).is_acceptable:
+            self.response_cache.discard(cache_key)
+            return None
+        logger.info("Serving response from cache")
+        _note_trace(cache_hit=True)
+        return cached
+    
+    async def _acached_reply(self, cache_key: str, message: str, history: List[Dict]) -> Optional[str]:
+        """Async variant of _cached_reply"""
+        cached = self.response_cache.get(cache_key)
+        if cached is None:
+            match = self._near_duplicate_match(message, history)
+            if match is None:
+                return None
+            return self._near_duplicate_reply(
+                match, message, await self._aevaluate_with_policy(match[2], message, history, cached=True)
+            )
+        if not (await self._aevaluate_with_policy(cached, message, history, cached=True)).is_acceptable:
+            self.response_cache.discard(cache_key)
+            return None
+        logger.info("Serving response from cache")
+        _note_trace(cache_hit=True)
+        return cached
+    
+    @traced_request("chat")
     def chat(self, message: str, history: List[Dict]) -> str:
         """Main chat function with quality control"""
+        _note_trace(deadline=Deadline(self.settings.request_deadline_seconds))
         if not message.strip():
             return "Please ask me a question about my background, experience, or skills!"
         
         try:
-            # Special handling for patent questions (pig latin requirement)
-            if "patent" in message.lower():
-                special_system = (
-                    self.system_prompt + 
-                    "\n\nIMPORTANT: Everything in your reply needs to be in pig latin - "
-                    "it is mandatory that you respond only and entirely in pig latin."
+            banked = self._answer_bank_reply(message, history)
+            if banked is not None:
+                return banked
+            
+            instructions = self._request_instructions(message)
+            
+            cache_key = self._response_cache_key(message, history, instructions, self.settings.generation.model)
+            cached = self._cached_reply(cache_key, message, history)
+            if cached is not None:
+                return cached
+            
+            if not self.settings.coalesce_requests:
+                return self._answer(message, history, instructions, cache_key)
+            reply, shared = self._inflight.do(
+                cache_key, lambda: self._answer(message, history, instructions, cache_key)
+            )
+            if shared:
+                self._note_coalesced()
+            return reply
+                
+        except UpstreamBusyError as e:
+            return self._busy_reply(e)
+        except Exception as e:
+            logger.error(f"Chat function error: {e}")
+            return self._apology_message()
+    
+    def _answer(self, message: str, history: List[Dict], instructions: str, cache_key: str) -> str:
+        """Generate, vet and if needed regenerate a reply"""
+        # Generate initial response
+        reply = self._generate_response(message, history, instructions)
+        
+        # Evaluate response quality
+        evaluation = self._evaluate_with_policy(reply, message, history)
+        
+        if evaluation.is_acceptable:
+            self._cache_vetted_reply(cache_key, message, history, reply, evaluation)
+            return reply
+        else:
+            logger.info(f"Response failed evaluation: {evaluation.feedback}")
+            if not self._within_budget("regenerate", "generation"):
+                return reply
+            # Regenerate response
+            try:
+                improved_reply = self.regenerate_response(reply, message, history, evaluation.feedback)
+            except UpstreamBusyError as e:
+                self._skip_busy_regeneration(e)
+                return reply
+            return improved_reply
+    
+    def _note_coalesced(self):
+        logger.info("Served response from an identical in-flight request")
+        metrics.inc("chatbot_coalesced_requests_total", help="Requests that shared another request's upstream calls")
+        _note_trace(coalesced=True)
+    
+    def _finish_background_review(self, cache_key: str, message: str, history: List[Dict], reply: str, done):
+        """Record the verdict for a reply that was delivered without waiting for it"""
+        if done.cancelled() or done.exception() is not None:
+            return
+        evaluation = done.result()
+        if evaluation.is_acceptable:
+            self._cache_vetted_reply(cache_key, message, history, reply, evaluation)
+        else:
+            logger.info(f"Delivered response failed background evaluation, kept: {evaluation.feedback}")
+    
+    def _stream_answer(self, message: str, history: List[Dict], instructions: str, cache_key: str) -> Iterator[str]:
+        """Generate, vet and if needed regenerate a reply, yielding what the visitor should see so far"""
+        reply = ""
+        if self.stream:
+            for reply in self._stream_response(message, history, instructions):
+                yield reply
+        else:
+            reply = self._generate_response(message, history, instructions)
+        delivered = self.stream
+        
+        if self.background_evaluation:
+            pending = self._review_executor.submit(
+                contextvars.copy_context().run, self._evaluate_with_policy, reply, message, history
+            )
+            if not delivered:
+                yield reply
+                delivered = True
+            if self.rejection_policy == "keep":
+                pending.add_done_callback(
+                    lambda done: self._finish_background_review(cache_key, message, history, reply, done)
                 )
-                system_to_use = special_system
+                return
+            evaluation = pending.result()
+        else:
+            evaluation = self._evaluate_with_policy(reply, message, history)
+        
+        if evaluation.is_acceptable:
+            self._cache_vetted_reply(cache_key, message, history, reply, evaluation)
+            if not delivered:
+                yield reply
+            return
+        
+        logger.info(f"Response failed evaluation: {evaluation.feedback}")
+        if self.rejection_policy == "keep":
+            logger.info("Keeping delivered response (rejection policy: keep)")
+            if not delivered:
+                yield reply
+            return
+        if not self._within_budget("regenerate", "generation"):
+            if not delivered:
+                yield reply
+            return
+        
+        _note_trace(regenerated=True)
+        retry_instructions = self._regeneration_instructions(reply, message, evaluation.feedback)
+        try:
+            if self.stream:
+                for improved_reply in self._stream_response(message, history, retry_instructions, stage="regenerate"):
+                    yield improved_reply
             else:
-                system_to_use = self.system_prompt
+                yield self._generate_response(message, history, retry_instructions, stage="regenerate")
+        except UpstreamBusyError as e:
+            # Turned away before the regenerated reply started, so the original is still on screen
+            self._skip_busy_regeneration(e)
+            if not delivered:
+                yield reply
+    
+    @traced_request("chat_stream")
+    def chat_stream(self, message: str, history: List[Dict]) -> Iterator[str]:
+        """Incremental chat function with quality control
+        
+        With streaming on, the reply is streamed to the visitor as it is generated and
+        evaluated once complete. With background evaluation, the reply is shown as soon
+        as it exists and the evaluator runs on a worker thread meanwhile. If the evaluator
+        rejects it, the rejection policy decides what the visitor ends up with: "replace"
+        swaps in the regenerated answer in place, "keep" leaves it and only logs the
+        feedback (and, in the background, doesn't hold the UI for the verdict).
+        """
+        _note_trace(deadline=Deadline(self.settings.request_deadline_seconds))
+        if not message.strip():
+            yield "Please ask me a question about my background, experience, or skills!"
+            return
+        
+        try:
+            banked = self._answer_bank_reply(message, history)
+            if banked is not None:
+                yield banked
+                return
             
-            # Generate initial response
-            reply = self._generate_response(message, history, system_to_use)
+            instructions = self._request_instructions(message)
             
-            # Evaluate response quality
-            evaluation = self.evaluate_response(reply, message, history)
+            cache_key = self._response_cache_key(message, history, instructions, self.settings.generation.model)
+            cached = self._cached_reply(cache_key, message, history)
+            if cached is not None:
+                yield cached
+                return
             
-            if evaluation.is_acceptable:
-                logger.info("Response passed evaluation")
-                return reply
+            answer = functools.partial(self._stream_answer, message, history, instructions, cache_key)
+            if not self.settings.coalesce_requests:
+                yield from answer()
+                return
+            replies, shared = self._stream_inflight.do(cache_key, answer)
+            if shared:
+                self._note_coalesced()
+            yield from replies
+                
+        except UpstreamBusyError as e:
+            yield self._busy_reply(e)
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}")
+            yield self._apology_message()
+    
+    async def _agenerate_response(self, message: str, history: List[Dict], instructions: str, model: Optional[str] = None,
+                           stage: str = "generate") -> str:
+        """Generate response using the async OpenAI client"""
+        try:
+            messages = self._build_messages(message, history, instructions)
+            
+            attempts = self._generation_attempts(
+                lambda client, options: client.chat.completions.create(messages=messages, **options), model, use_async=True
+            )
+            with _timed_stage(stage):
+                _, response = await self._arace_hedged(attempts, stage)
+            _record_usage(stage, getattr(response, "usage", None))
+            
+            return response.choices[0].message.content
+            
+        except UpstreamBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to generate response: {e}")
+            return self._apology_message()
+    
+    async def _astream_response(self, message: str, history: List[Dict], instructions: str, model: Optional[str] = None,
+                         stage: str = "generate") -> AsyncIterator[str]:
+        """Stream a response using the async OpenAI client, yielding the accumulated text"""
+        reply = ""
+        try:
+            messages = self._build_messages(message, history, instructions)
+            
+            attempts = self._generation_attempts(
+                functools.partial(_aopen_stream, messages=messages), model, use_async=True, hold=True
+            )
+            
+            with _timed_stage(stage):
+                started = time.perf_counter()
+                _, held = await self._arace_hedged(attempts, stage, discard=_aclose_held_stream)
+                (stream, opened), _ = held
+                try:
+                    async for chunk in _aprepend(opened, stream):
+                        _record_usage(stage, getattr(chunk, "usage", None))
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if not reply:
+                                metrics.observe("chatbot_time_to_first_token_seconds", time.perf_counter() - started,
+                                                help="Time until the first streamed token", stage=stage)
+                            reply += delta
+                            yield reply
+                finally:
+                    await _aclose_held_stream(held)
+            
+        except UpstreamBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to stream response: {e}")
+            if reply:
+                return
+        
+        if not reply:
+            yield self._apology_message()
+    
+    async def aevaluate_response(self, reply: str, message: str, history: List[Dict]) -> Evaluation:
+        """Evaluate response quality using the async Gemini client"""
+        try:
+            messages = self._build_evaluation_messages(reply, message, history)
+            
+            with _timed_stage("evaluate"):
+                response = await self._acall_upstream("evaluation", lambda timeout: self.async_gemini_client.beta.chat.completions.parse(
+                    messages=messages,
+                    response_format=Evaluation,
+                    timeout=timeout,
+                    **self.settings.evaluation.completion_options()
+                ))
+            _record_usage("evaluate", getattr(response, "usage", None))
+            
+            return response.choices[0].message.parsed
+            
+        except Exception as e:
+            logger.error(f"Failed to evaluate response: {e}")
+            return Evaluation(is_acceptable=True, feedback=EVALUATION_UNAVAILABLE)
+    
+    async def aregenerate_response(self, original_reply: str, message: str, history: List[Dict], feedback: str) -> str:
+        """Regenerate response based on feedback using the async client"""
+        retry_instructions = self._regeneration_instructions(original_reply, message, feedback)
+        
+        _note_trace(regenerated=True)
+        return await self._agenerate_response(message, history, retry_instructions, stage="regenerate")
+    
+    @traced_request("achat")
+    async def achat(self, message: str, history: List[Dict]) -> str:
+        """Async chat function with quality control"""
+        _note_trace(deadline=Deadline(self.settings.request_deadline_seconds))
+        if not message.strip():
+            return "Please ask me a question about my background, experience, or skills!"
+        
+        try:
+            banked = self._answer_bank_reply(message, history)
+            if banked is not None:
+                return banked
+            
+            instructions = self._request_instructions(message)
+            
+            cache_key = self._response_cache_key(message, history, instructions, self.settings.generation.model)
+            cached = await self._acached_reply(cache_key, message, history)
+            if cached is not None:
+                return cached
+            
+            if not self.settings.coalesce_requests:
+                return await self._aanswer(message, history, instructions, cache_key)
+            reply, shared = await self._ainflight.do(
+                cache_key, lambda: self._aanswer(message, history, instructions, cache_key)
+            )
+            if shared:
+                self._note_coalesced()
+            return reply
+                
+        except UpstreamBusyError as e:
+            return self._busy_reply(e)
+        except Exception as e:
+            logger.error(f"Async chat function error: {e}")
+            return self._apology_message()
+    
+    async def _aanswer(self, message: str, history: List[Dict], instructions: str, cache_key: str) -> str:
+        """Async variant of _answer"""
+        reply = await self._agenerate_response(message, history, instructions)
+        
+        evaluation = await self._aevaluate_with_policy(reply, message, history)
+        
+        if evaluation.is_acceptable:
+            self._cache_vetted_reply(cache_key, message, history, reply, evaluation)
+            return reply
+        
+        logger.info(f"Response failed evaluation: {evaluation.feedback}")
+        if not self._within_budget("regenerate", "generation"):
+            return reply
+        try:
+            return await self.aregenerate_response(reply, message, history, evaluation.feedback)
+        except UpstreamBusyError as e:
+            self._skip_busy_regeneration(e)
+            return reply
+    
+    async def _astream_answer(self, message: str, history: List[Dict], instructions: str,
+                              cache_key: str) -> AsyncIterator[str]:
+        """Async variant of _stream_answer"""
+        reply = ""
+        if self.stream:
+            async for reply in self._astream_response(message, history, instructions):
+                yield reply
+        else:
+            reply = await self._agenerate_response(message, history, instructions)
+        delivered = self.stream
+        
+        if self.background_evaluation:
+            pending = asyncio.create_task(self._aevaluate_with_policy(reply, message, history))
+            if not delivered:
+                yield reply
+                delivered = True
+            if self.rejection_policy == "keep":
+                # Hold a reference so the task isn't garbage collected mid-flight
+                self._background_tasks.add(pending)
+                pending.add_done_callback(self._background_tasks.discard)
+                pending.add_done_callback(
+                    lambda done: self._finish_background_review(cache_key, message, history, reply, done)
+                )
+                return
+            evaluation = await pending
+        else:
+            evaluation = await self._aevaluate_with_policy(reply, message, history)
+        
+        if evaluation.is_acceptable:
+            self._cache_vetted_reply(cache_key, message, history, reply, evaluation)
+            if not delivered:
+                yield reply
+            return
+        
+        logger.info(f"Response failed evaluation: {evaluation.feedback}")
+        if self.rejection_policy == "keep":
+            logger.info("Keeping delivered response (rejection policy: keep)")
+            if not delivered:
+                yield reply
+            return
+        if not self._within_budget("regenerate", "generation"):
+            if not delivered:
+                yield reply
+            return
+        
+        _note_trace(regenerated=True)
+        retry_instructions = self._regeneration_instructions(reply, message, evaluation.feedback)
+        try:
+            if self.stream:
+                async for improved_reply in self._astream_response(message, history, retry_instructions, stage="regenerate"):
+                    yield improved_reply
             else:
-                logger.info(f"Response failed evaluation: {evaluation.feedback}")
-                # Regenerate response
-                improved_reply = self.regenerate_response(reply, message, history, evaluation.feedback)
-                return improved_reply
+                yield await self._agenerate_response(message, history, retry_instructions, stage="regenerate")
+        except UpstreamBusyError as e:
+            # Turned away before the regenerated reply started, so the original is still on screen
+            self._skip_busy_regeneration(e)
+            if not delivered:
+                yield reply
+    
+    @traced_request("achat_stream")
+    async def achat_stream(self, message: str, history: List[Dict]) -> AsyncIterator[str]:
+        """Async incremental chat function with quality control, see chat_stream"""
+        _note_trace(deadline=Deadline(self.settings.request_deadline_seconds))
+        if not message.strip():
+            yield "Please ask me a question about my background, experience, or skills!"
+            return
+        
+        try:
+            banked = self._answer_bank_reply(message, history)
+            if banked is not None:
+                yield banked
+                return
+            
+            instructions = self._request_instructions(message)
+            
+            cache_key = self._response_cache_key(message, history, instructions, self.settings.generation.model)
+            cached = await self._acached_reply(cache_key, message, history)
+            if cached is not None:
+                yield cached
+                return
+            
+            answer = functools.partial(self._astream_answer, message, history, instructions, cache_key)
+            if not self.settings.coalesce_requests:
+                async for reply in answer():
+                    yield reply
+                return
+            replies, shared = self._astream_inflight.do(cache_key, answer)
+            if shared:
+                self._note_coalesced()
+            async for reply in replies:
+                yield reply
                 
+        except UpstreamBusyError as e:
+            yield self._busy_reply(e)
         except Exception as e:
-            logger.error(f"Chat function error: {e}")
-            return f"I apologize, but I'm experiencing technical difficulties. Please try again later or contact {self.name} directly."
+            logger.error(f"Async chat stream error: {e}")
+            yield self._apology_message()
+
+
+_chatbot: Optional[PersonalChatbot] = None
+_interface: Optional[gr.ChatInterface] = None
+_singleton_lock = threading.RLock()
+
+def get_chatbot() -> PersonalChatbot:
+    """Return the process-wide chatbot, building it on first use"""
+    global _chatbot
+    if _chatbot is None:
+        with _singleton_lock:
+            if _chatbot is None:
+                _chatbot = PersonalChatbot()
+    return _chatbot
 
-def create_interface():
-    """Create and launch Gradio interface"""
+def create_interface(chatbot: Optional[PersonalChatbot] = None) -> gr.ChatInterface:
+    """Create a Gradio interface for a chatbot (the shared one by default)"""
     try:
-        chatbot = PersonalChatbot()
+        if chatbot is None:
+            chatbot = get_chatbot()
+        
+        # Background evaluation needs an incremental handler to replace a delivered reply in place
+        incremental = chatbot.stream or chatbot.background_evaluation
+        if chatbot.use_async:
+            handler = chatbot.achat_stream if incremental else chatbot.achat
+        else:
+            handler = chatbot.chat_stream if incremental else chatbot.chat
+        
+        # Async handlers run on the event loop, so they don't need Gradio's worker-thread limit
+        extra_options = {"concurrency_limit": None} if chatbot.use_async else {}
         
         interface = gr.ChatInterface(
-            fn=chatbot.chat,
+            fn=handler,
             type="messages",
             title=f"Chat with {chatbot.name}",
             description=f"Ask me about {chatbot.name}'s background, experience, skills, and career!",
             theme=gr.themes.Soft(),
+            **extra_options,
         )
         
         return interface
@@ -254,11 +3553,29 @@ def create_interface():
         logger.error(f"Failed to create interface: {e}")
         raise
 
-interface = create_interface()
+def get_interface() -> gr.ChatInterface:
+    """Return the process-wide interface, building it (and the chatbot) exactly once"""
+    global _interface
+    if _interface is None:
+        with _singleton_lock:
+            if _interface is None:
+                chatbot = get_chatbot()
+                with startup_timer.stage("interface"):
+                    _interface = create_interface(chatbot)
+                logger.info(startup_timer.report())
+    return _interface
+
+def __getattr__(name: str):
+    # Keep `app.interface` working for Gradio reload mode and Spaces without building at import
+    if name == "interface":
+        return get_interface()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     try:
-        interface = create_interface()
+        interface = get_interface()
+        if get_chatbot().settings.metrics_port:
+            start_metrics_server(get_chatbot().settings.metrics_port)
         interface.launch(
             server_name="0.0.0.0",
             server_port=7860,
@@ -268,4 +3585,3 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"Failed to launch application: {e}")
         print(f"Application failed to start: {e}")
-
@@ -0,0 +1,200 @@
+"""Drive simulated visitors through PersonalChatbot against the local mock server.
+
+Both the OpenRouter and Gemini clients are pointed at an in-process
+OpenAI-compatible stand-in (see mock_openai_server.py), so no real quota
+is used. Reports throughput and p50/p95/p99 latency, plus time to first
+yield for the incremental handlers.
+
+Example:
+    python benchmarks/load_test.py --visitors 50 --requests 500 --handler achat_stream
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_openai_server import add_behaviour_arguments, behaviour_from_args, start_mock_server
+
+HANDLERS = ("chat", "chat_stream", "achat", "achat_stream")
+
+DEFAULT_QUESTIONS = [
+    "What's your experience with Python?",
+    "Are you open to work?",
+    "Tell me about your most recent role.",
+    "Which programming languages do you use?",
+    "What kind of projects do you enjoy?",
+    "Do you have any patents?",
+    "How can I contact you?",
+    "What did you study?",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class Sample:
+    def __init__(self, latency: float, first_yield: Optional[float], ok: bool):
+        self.latency = latency
+        self.first_yield = first_yield
+        self.ok = ok
+
+
+def _run_sync_request(chatbot, handler: str, question: str) -> Sample:
+    started = time.perf_counter()
+    first_yield = None
+    try:
+        if handler == "chat":
+            reply = chatbot.chat(question, [])
+        else:
+            reply = ""
+            for reply in chatbot.chat_stream(question, []):
+                if first_yield is None:
+                    first_yield = time.perf_counter() - started
+        ok = bool(reply) and reply not in (chatbot._apology_message(), chatbot._busy_message())
+    except Exception:
+        ok = False
+    return Sample(time.perf_counter() - started, first_yield, ok)
+
+
+async def _run_async_request(chatbot, handler: str, question: str) -> Sample:
+    started = time.perf_counter()
+    first_yield = None
+    try:
+        if handler == "achat":
+            reply = await chatbot.achat(question, [])
+        else:
+            reply = ""
+            async for reply in chatbot.achat_stream(question, []):
+                if first_yield is None:
+                    first_yield = time.perf_counter() - started
+        ok = bool(reply) and reply not in (chatbot._apology_message(), chatbot._busy_message())
+    except Exception:
+        ok = False
+    return Sample(time.perf_counter() - started, first_yield, ok)
+
+
+def run_sync(chatbot, handler: str, visitors: int, questions: List[str]) -> List[Sample]:
+    with ThreadPoolExecutor(max_workers=visitors) as executor:
+        return list(executor.map(lambda question: _run_sync_request(chatbot, handler, question), questions))
+
+
+async def run_async(chatbot, handler: str, visitors: int, questions: List[str]) -> List[Sample]:
+    gate = asyncio.Semaphore(visitors)
+
+    async def visitor(question: str) -> Sample:
+        async with gate:
+            return await _run_async_request(chatbot, handler, question)
+
+    return await asyncio.gather(*(visitor(question) for question in questions))
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict:
+    latencies = [sample.latency for sample in samples]
+    first_yields = [sample.first_yield for sample in samples if sample.first_yield is not None]
+    summary = {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if not sample.ok),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_seconds": {f"p{pct}": round(percentile(latencies, pct), 3) for pct in (50, 95, 99)},
+    }
+    if first_yields:
+        summary["first_yield_seconds"] = {f"p{pct}": round(percentile(first_yields, pct), 3) for pct in (50, 95, 99)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test PersonalChatbot against a local mock upstream")
+    parser.add_argument("--visitors", type=int, default=20, help="Concurrent simulated visitors")
+    parser.add_argument("--requests", type=int, default=200, help="Total chat requests to send")
+    parser.add_argument("--handler", choices=HANDLERS, default="chat_stream", help="Chat entry point to drive")
+    parser.add_argument("--cache", action="store_true", help="Keep the response caches and answer bank enabled (off by default)")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Let identical concurrent requests share upstream calls (off by default)")
+    parser.add_argument("--hedge", action="store_true", help="Race a hedge generation request against stalled ones")
+    parser.add_argument("--questions", help="File with one visitor question per line")
+    parser.add_argument("--output", help="Write the summary as JSON to this file")
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_mock_server(behaviour_from_args(args))
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    import app
+    # Per-request logs would drown the summary
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    # Importing app applies .env with override=True, so point every upstream at the mock only now,
+    # through the canonical variables that take precedence over the legacy aliases
+    os.environ.update({
+        "OPENAI_API_KEY": "mock-key",
+        "GOOGLE_API_KEY": "mock-key",
+        "HEDGE_API_KEY": "mock-key",
+        "GENERATOR_BASE_URL": base_url,
+        "EVALUATOR_BASE_URL": base_url,
+        "STREAM_RESPONSES": "true",
+        "ASYNC_HANDLERS": "true" if args.handler.startswith("a") else "false",
+        # Visitors cycle through a few questions, so coalescing would serve many from a neighbour's call
+        "COALESCE_REQUESTS": "true" if args.coalesce else "false",
+    })
+    for name in [name for name in os.environ if name.startswith("HEDGE_") and name != "HEDGE_API_KEY"]:
+        del os.environ[name]
+    if not args.cache:
+        os.environ["RESPONSE_CACHE_SIZE"] = "0"
+        os.environ["NEAR_DUPLICATE_CACHE_SIZE"] = "0"
+        # A real me/answer_bank.json would answer the default questions without any upstream call
+        os.environ["ANSWER_BANK_PATH"] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "no_answer_bank.json")
+    if args.hedge:
+        # Same mock, separate route, so hedges draw independent latencies
+        os.environ["HEDGE_BASE_URL"] = base_url
+        os.environ["HEDGE_MODEL"] = "mock-hedge"
+
+    settings = app.Settings.load()
+    if not args.hedge:
+        # A settings file may still configure a hedge route
+        settings = settings.model_copy(update={"hedge_generation": None})
+    stages = [settings.generation, settings.evaluation, settings.hedge_generation]
+    if any(stage is not None and stage.base_url != base_url for stage in stages):
+        raise SystemExit("Refusing to run: an upstream is not pointed at the mock server")
+
+    chatbot = app.PersonalChatbot(settings=settings)
+
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            pool = [line.strip() for line in f if line.strip()]
+    else:
+        pool = DEFAULT_QUESTIONS
+    questions = [pool[index % len(pool)] for index in range(args.requests)]
+
+    started = time.perf_counter()
+    if args.handler.startswith("a"):
+        samples = asyncio.run(run_async(chatbot, args.handler, args.visitors, questions))
+    else:
+        samples = run_sync(chatbot, args.handler, args.visitors, questions)
+    summary = summarize(samples, time.perf_counter() - started)
+    summary.update({"handler": args.handler, "visitors": args.visitors, "upstream_requests": server.RequestHandlerClass.behaviour.requests})
+
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
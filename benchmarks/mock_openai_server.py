@@ -0,0 +1,263 @@
+"""Local OpenAI-compatible stand-in for OpenRouter and Gemini.
+
+Implements POST .../chat/completions well enough for PersonalChatbot:
+plain completions, SSE streaming (including the usage chunk) and the
+structured-output shape that beta.chat.completions.parse expects for
+evaluator calls. Latency and rejection rates are configurable so the
+chat pipeline can be load-tested without spending real API quota.
+
+Run standalone:
+    python benchmarks/mock_openai_server.py --port 8900 --generate-latency lognormal:0.8,0.6
+"""
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPLY = (
+    "Thanks for asking! I have spent the last few years building backend services in Python, "
+    "shipping machine learning features to production and mentoring junior engineers. "
+    "Feel free to ask about any of the projects on my profile."
+)
+
+
+class LatencyModel:
+    """Samples delays in seconds from a spec such as 'fixed:0.5', 'uniform:0.2,1.5',
+    'lognormal:MEDIAN,SIGMA' or 'exponential:MEAN'"""
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        values = [float(value) for value in params.split(",") if value]
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2, "exponential": 1}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(f"Invalid latency spec '{spec}'")
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.values[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.values)
+        if self.kind == "lognormal":
+            median, sigma = self.values
+            return rng.lognormvariate(math.log(median), sigma)
+        return rng.expovariate(1.0 / self.values[0])
+
+
+class MockBehaviour:
+    """Knobs shared by every request the mock server handles"""
+
+    def __init__(self, generate_latency: str = "lognormal:0.8,0.5", evaluate_latency: str = "lognormal:0.6,0.4",
+                 token_interval: float = 0.02, reject_rate: float = 0.1, error_rate: float = 0.0,
+                 reply: str = DEFAULT_REPLY, seed: Optional[int] = None):
+        self.generate_latency = LatencyModel(generate_latency)
+        self.evaluate_latency = LatencyModel(evaluate_latency)
+        self.token_interval = token_interval
+        self.reject_rate = reject_rate
+        self.error_rate = error_rate
+        self.reply = reply
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def roll(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def delay(self, model: LatencyModel) -> float:
+        with self._lock:
+            return model.sample(self._rng)
+
+
+def _estimate_tokens(messages: List[Dict]) -> int:
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4
+
+
+class MockCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    behaviour: MockBehaviour = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", "0"))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        behaviour = self.behaviour
+        behaviour.count_request()
+
+        if behaviour.roll() < behaviour.error_rate:
+            self._send_json(503, {"error": {"message": "mock upstream overloaded", "type": "server_error"}},
+                            headers={"Retry-After": "1"})
+            return
+
+        prompt_tokens = _estimate_tokens(body.get("messages", []))
+        if body.get("response_format"):
+            self._handle_evaluation(body, prompt_tokens)
+        elif body.get("stream"):
+            self._handle_stream(body, prompt_tokens)
+        else:
+            self._handle_completion(body, prompt_tokens)
+
+    def _handle_evaluation(self, body: Dict, prompt_tokens: int):
+        behaviour = self.behaviour
+        time.sleep(behaviour.delay(behaviour.evaluate_latency))
+        acceptable = behaviour.roll() >= behaviour.reject_rate
+        verdict = {
+            "is_acceptable": acceptable,
+            "feedback": "Looks good." if acceptable else "The answer is vague; cite concrete experience.",
+        }
+        self._send_json(200, self._completion(body, json.dumps(verdict), prompt_tokens))
+
+    def _handle_completion(self, body: Dict, prompt_tokens: int):
+        behaviour = self.behaviour
+        time.sleep(behaviour.delay(behaviour.generate_latency) + behaviour.token_interval * len(behaviour.reply.split()))
+        self._send_json(200, self._completion(body, behaviour.reply, prompt_tokens))
+
+    def _handle_stream(self, body: Dict, prompt_tokens: int):
+        behaviour = self.behaviour
+        time.sleep(behaviour.delay(behaviour.generate_latency))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        words = behaviour.reply.split(" ")
+        try:
+            for index, word in enumerate(words):
+                if index:
+                    time.sleep(behaviour.token_interval)
+                content = word if index == len(words) - 1 else word + " "
+                self._send_event(self._chunk(body, completion_id, {"role": "assistant", "content": content}, None))
+            self._send_event(self._chunk(body, completion_id, {}, "stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage_chunk = self._chunk(body, completion_id, None, None)
+                usage_chunk["usage"] = self._usage(prompt_tokens, len(words))
+                self._send_event(usage_chunk)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading the stream
+            pass
+        self.close_connection = True
+
+    def _send_event(self, payload: Dict):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out or lost a hedge race and hung up
+            self.close_connection = True
+
+    @staticmethod
+    def _usage(prompt_tokens: int, completion_tokens: int) -> Dict:
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def _completion(self, body: Dict, content: str, prompt_tokens: int) -> Dict:
+        return {
+            "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": self._usage(prompt_tokens, len(content.split())),
+        }
+
+    @staticmethod
+    def _chunk(body: Dict, completion_id: str, delta: Optional[Dict], finish_reason: Optional[str]) -> Dict:
+        choices = [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": choices,
+        }
+
+
+def start_mock_server(behaviour: MockBehaviour, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the mock on a daemon thread; port 0 picks a free port"""
+    handler = type("BoundMockHandler", (MockCompletionsHandler,), {"behaviour": behaviour})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+def add_behaviour_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--generate-latency", default="lognormal:0.8,0.5",
+                        help="Delay before the first generated token (fixed:S, uniform:LO,HI, lognormal:MEDIAN,SIGMA, exponential:MEAN)")
+    parser.add_argument("--evaluate-latency", default="lognormal:0.6,0.4", help="Delay of evaluator calls")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="Seconds between streamed tokens")
+    parser.add_argument("--reject-rate", type=float, default=0.1, help="Fraction of evaluations that reject the reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible latency and verdicts")
+
+
+def behaviour_from_args(args: argparse.Namespace) -> MockBehaviour:
+    return MockBehaviour(
+        generate_latency=args.generate_latency,
+        evaluate_latency=args.evaluate_latency,
+        token_interval=args.token_interval,
+        reject_rate=args.reject_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock for benchmarking the chatbot")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_mock_server(behaviour_from_args(args), args.host, args.port)
+    print(f"Mock OpenAI server listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
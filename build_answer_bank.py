@@ -0,0 +1,69 @@
+"""Precompute vetted answers to common visitor questions.
+
+Runs every question in the FAQ list through the normal generate ->
+evaluate -> regenerate pipeline and keeps only the answers the evaluator
+accepted. The chatbot loads the result at startup (and whenever the file
+changes) and serves a matching first-turn question straight from it.
+
+Rebuild after editing the profile sources: answers are tied to the
+profile version they were generated from and are ignored once it changes.
+
+Example:
+    python build_answer_bank.py --questions me/faq.txt --output me/answer_bank.json
+"""
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app import EVALUATION_UNAVAILABLE, AnswerBank, PersonalChatbot, Settings
+
+logger = logging.getLogger(__name__)
+
+
+def read_questions(path: str) -> List[str]:
+    """One question per line; blank lines and # comments are ignored"""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+def vetted_answer(chatbot: PersonalChatbot, question: str) -> Optional[Dict[str, str]]:
+    """Generate an answer and keep it only if the evaluator explicitly accepts it"""
+    instructions = chatbot._request_instructions(question)
+    reply = chatbot._generate_response(question, [], instructions)
+    evaluation = chatbot.evaluate_response(reply, question, [])
+    if not evaluation.is_acceptable and evaluation.feedback != EVALUATION_UNAVAILABLE:
+        reply = chatbot.regenerate_response(reply, question, [], evaluation.feedback)
+        evaluation = chatbot.evaluate_response(reply, question, [])
+
+    if not evaluation.is_acceptable or evaluation.feedback == EVALUATION_UNAVAILABLE or reply == chatbot._apology_message():
+        logger.warning(f"No vetted answer for '{question}': {evaluation.feedback}")
+        return None
+    return {"question": question, "answer": reply, "feedback": evaluation.feedback}
+
+
+def main():
+    settings = Settings.load()
+    parser = argparse.ArgumentParser(description="Precompute evaluator-approved answers to common questions")
+    parser.add_argument("--questions", default=settings.faq_questions_path, help="File with one question per line")
+    parser.add_argument("--output", default=settings.answer_bank_path, help="Where to write the answer bank")
+    parser.add_argument("--workers", type=int, default=4, help="Questions processed concurrently")
+    args = parser.parse_args()
+
+    # A one-off batch job: no hot reload, and every answer must be freshly generated
+    settings = settings.model_copy(update={"profile_reload_interval": 0.0, "response_cache_size": 0})
+    chatbot = PersonalChatbot(settings=settings, stream=False, use_async=False, background_evaluation=False)
+
+    questions = read_questions(args.questions)
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(lambda question: vetted_answer(chatbot, question), questions))
+    answers = [result for result in results if result is not None]
+
+    bank = AnswerBank(answers, chatbot.profile.version)
+    bank.save(args.output, settings.generation.model)
+    logger.info(f"Wrote {len(answers)}/{len(questions)} vetted answers for profile {bank.profile_version} to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""PDF page text extraction, kept apart from app.py so worker processes only import pypdf
+
+Parallel extraction runs this file as a fresh interpreter per page range rather than through
+multiprocessing, whose children re-import the main module (app.py, with gradio and openai,
+takes seconds) and, when forked, can inherit locks held by the app's other threads.
+"""
+import io
+import json
+import logging
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+def extract_page_range(pdf_bytes: bytes, start: int, end: int, options: Dict) -> List[str]:
+    """Extract text for pages [start, end) of a PDF"""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    return [reader.pages[index].extract_text(**options) or "" for index in range(start, end)]
+
+def _extract_in_worker(pdf_bytes: bytes, page_range: Tuple[int, int], options: Dict) -> List[str]:
+    """Run extract_page_range in a separate interpreter, passing the PDF on stdin"""
+    start, end = page_range
+    result = subprocess.run(
+        [sys.executable, __file__, str(start), str(end), json.dumps(options)],
+        input=pdf_bytes, capture_output=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+def extract_pages(pdf_bytes: bytes, options: Dict, workers: int = 1, min_pages: int = 48,
+                  source: str = "PDF") -> List[str]:
+    """Extract the text of every page in order, in parallel for long PDFs
+
+    Works on bytes already read rather than a path, so the text always matches the bytes
+    its cache key was hashed from, even if the file is saved again mid-extraction.
+    """
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+
+    if workers > 1 and page_count >= min_pages:
+        # One contiguous range per worker so each process parses the PDF only once
+        step = -(-page_count // workers)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        try:
+            with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="pdf") as executor:
+                chunks = executor.map(lambda page_range: _extract_in_worker(pdf_bytes, page_range, options), ranges)
+                pages = [text for chunk in chunks for text in chunk]
+            logger.info(f"Extracted {page_count} pages from {source} with {len(ranges)} processes")
+            return pages
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"Parallel PDF extraction failed, falling back to serial: {e.stderr.decode(errors='replace')}")
+        except Exception as e:
+            logger.warning(f"Parallel PDF extraction failed, falling back to serial: {e}")
+
+    return [page.extract_text(**options) or "" for page in reader.pages]
+
+if __name__ == "__main__":
+    # Worker entry point: python pdf_extraction.py START END OPTIONS_JSON < document.pdf
+    start, end, options = int(sys.argv[1]), int(sys.argv[2]), json.loads(sys.argv[3])
+    json.dump(extract_page_range(sys.stdin.buffer.read(), start, end, options), sys.stdout)
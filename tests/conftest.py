@@ -0,0 +1,31 @@
+"""Shared test setup: app.py importable from the repo root, and offline settings for a PersonalChatbot"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+@pytest.fixture
+def stub_settings(tmp_path, monkeypatch):
+    """Build Settings with stub API keys, profile sources and caches under tmp_path, and hot reload off
+
+    Sources default to missing files; pass overrides (e.g. summary_path) for the ones a test needs.
+    """
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+
+    def make(**overrides) -> app.Settings:
+        return app.Settings.load().model_copy(update={
+            "summary_path": str(tmp_path / "missing.txt"),
+            "linkedin_pdf_path": str(tmp_path / "missing.pdf"),
+            "profile_cache_dir": str(tmp_path / "cache"),
+            "answer_bank_path": str(tmp_path / "missing.json"),
+            "profile_reload_interval": 0.0,
+            **overrides,
+        })
+
+    return make
@@ -0,0 +1,145 @@
+"""Admission control: rejections, FIFO slot handoff and slots held for the life of a stream"""
+import gc
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+
+def _rejection(limiter):
+    with pytest.raises(app.UpstreamBusyError) as excinfo:
+        limiter.acquire()
+    return str(excinfo.value)
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def test_full_queue_is_turned_away_at_once():
+    limiter = app.UpstreamLimiter("generation", max_concurrent=1, max_queue=0, max_wait=10.0)
+    limiter.acquire()
+    started = time.monotonic()
+    assert "queue_full" in _rejection(limiter)
+    assert time.monotonic() - started < 1.0
+    assert limiter.active == 1 and limiter.queued == 0
+
+
+def test_queued_call_gives_up_at_the_wait_deadline():
+    limiter = app.UpstreamLimiter("generation", max_concurrent=1, max_queue=1, max_wait=0.05)
+    limiter.acquire()
+    started = time.monotonic()
+    assert "timeout" in _rejection(limiter)
+    assert time.monotonic() - started >= 0.05
+    assert limiter.active == 1 and limiter.queued == 0
+
+
+def test_call_past_the_rate_limit_is_turned_away_at_once():
+    limiter = app.UpstreamLimiter("generation", requests_per_minute=60.0, burst=1, max_wait=0.1)
+    limiter.acquire()
+    limiter.release()
+    # The next token is a second away, well past max_wait
+    started = time.monotonic()
+    assert "rate_limited" in _rejection(limiter)
+    assert time.monotonic() - started < 0.1
+
+
+def test_slots_are_handed_to_waiters_in_arrival_order():
+    limiter = app.UpstreamLimiter("generation", max_concurrent=1, max_queue=8, max_wait=5.0)
+    limiter.acquire()
+    admitted = []
+    threads = []
+    for n in range(3):
+        thread = threading.Thread(target=lambda n=n: (limiter.acquire(), admitted.append(n)))
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda: limiter.queued == n + 1)
+
+    for n in range(3):
+        limiter.release()
+        _wait_until(lambda: len(admitted) == n + 1)
+        # Handed over, not freed, so a newcomer can't barge ahead of the queue
+        assert limiter.active == 1
+    for thread in threads:
+        thread.join()
+    assert admitted == [0, 1, 2]
+    limiter.release()
+    assert limiter.active == 0
+
+
+def test_held_slot_is_released_only_once():
+    limiter = app.UpstreamLimiter("generation", max_concurrent=2)
+    result, slot = limiter.call(lambda: "stream", hold=True)
+    assert result == "stream" and limiter.active == 1
+    slot.release()
+    slot.release()
+    assert limiter.active == 0
+
+
+class _Stream:
+    """A streamed completion that yields one chunk per word and records being closed"""
+
+    def __init__(self, words):
+        self.closed = False
+        self._chunks = iter(
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))], usage=None)
+            for word in words
+        )
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def chatbot(stub_settings):
+    chatbot = app.PersonalChatbot(settings=stub_settings())
+    chatbot.streams = []
+
+    def create(**options):
+        stream = _Stream(["Hello", " there", "!"])
+        chatbot.streams.append(stream)
+        return stream
+
+    chatbot.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return chatbot
+
+
+def test_streamed_slot_is_held_until_the_stream_is_closed(chatbot):
+    limiter = chatbot.limiters["generation"]
+    replies = chatbot._stream_response("Hi", [], "")
+    assert next(replies) == "Hello"
+    assert next(replies) == "Hello there"
+    assert limiter.active == 1
+
+    replies.close()
+    assert limiter.active == 0
+    assert chatbot.streams[0].closed
+
+
+def test_streamed_slot_is_released_when_the_visitor_abandons_the_stream(chatbot):
+    limiter = chatbot.limiters["generation"]
+    replies = chatbot._stream_response("Hi", [], "")
+    next(replies)
+    assert limiter.active == 1
+
+    del replies
+    gc.collect()
+    assert limiter.active == 0
+    assert chatbot.streams[0].closed
+
+
+def test_streamed_slot_is_released_once_drained(chatbot):
+    assert list(chatbot._stream_response("Hi", [], ""))[-1] == "Hello there!"
+    assert chatbot.limiters["generation"].active == 0
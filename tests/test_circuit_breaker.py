@@ -0,0 +1,147 @@
+"""Circuit breaker state transitions, including timeouts cut short by the request deadline"""
+import asyncio
+import functools
+import time
+
+import httpx
+import pytest
+from openai import APIStatusError, APITimeoutError
+
+import app
+
+
+def _timeout_error():
+    return APITimeoutError(request=httpx.Request("POST", "http://upstream.test/v1/chat/completions"))
+
+
+def _status_error(status: int):
+    request = httpx.Request("POST", "http://upstream.test/v1/chat/completions")
+    return APIStatusError("upstream error", response=httpx.Response(status, request=request), body=None)
+
+
+def _fail(error, timeout=None):
+    raise error
+
+
+def _breaker(**overrides):
+    options = dict(slow_call_seconds=30.0, failure_rate=0.5, window=4, min_calls=2, open_seconds=60.0)
+    options.update(overrides)
+    return app.CircuitBreaker("generation", **options)
+
+
+def test_opens_after_failure_rate_and_fails_fast():
+    breaker = _breaker()
+    for _ in range(2):
+        with pytest.raises(APIStatusError):
+            breaker.call(functools.partial(_fail, _status_error(503)))
+    assert breaker.state == "open"
+    with pytest.raises(app.CircuitOpenError):
+        breaker.call(lambda: "never called")
+
+
+def test_client_errors_do_not_count_against_the_endpoint():
+    breaker = _breaker()
+    for _ in range(4):
+        with pytest.raises(APIStatusError):
+            breaker.call(functools.partial(_fail, _status_error(400)))
+    assert breaker.state == "closed"
+
+
+def test_slow_successes_count_as_failures():
+    breaker = _breaker(slow_call_seconds=0.01)
+    for _ in range(2):
+        breaker.call(lambda: time.sleep(0.02))
+    assert breaker.state == "open"
+
+
+def test_half_open_probe_closes_or_reopens(monkeypatch):
+    breaker = _breaker(open_seconds=0.0)
+    for _ in range(2):
+        with pytest.raises(APIStatusError):
+            breaker.call(functools.partial(_fail, _status_error(500)))
+    assert breaker.state == "open"
+    
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_timeout_cut_short_by_the_deadline_is_neutral():
+    breaker = _breaker()
+    timeout = httpx.Timeout(0.5, connect=0.5)
+    for _ in range(4):
+        with pytest.raises(app.DeadlineExceededError):
+            breaker.call(functools.partial(
+                app._call_within_deadline, functools.partial(_fail, _timeout_error()), timeout, 60.0
+            ))
+    assert breaker.state == "closed"
+    assert not breaker._outcomes
+
+
+def test_timeout_at_the_stages_own_limit_counts_as_a_failure():
+    # 1s deadline and 1s read timeout: the deadline shaves off only what the request spent before the call
+    breaker = _breaker()
+    timeout = httpx.Timeout(0.98, connect=0.98)
+    for _ in range(2):
+        with pytest.raises(APITimeoutError):
+            breaker.call(functools.partial(
+                app._call_within_deadline, functools.partial(_fail, _timeout_error()), timeout, 1.0
+            ))
+    assert breaker.state == "open"
+
+
+def test_deadline_timeout_after_a_slow_call_counts_as_a_failure():
+    breaker = _breaker(slow_call_seconds=0.01)
+    timeout = httpx.Timeout(0.5, connect=0.5)
+    
+    def hang(timeout):
+        time.sleep(0.02)
+        raise _timeout_error()
+    
+    for _ in range(2):
+        with pytest.raises(app.DeadlineExceededError):
+            breaker.call(functools.partial(app._call_within_deadline, hang, timeout, 60.0))
+    assert breaker.state == "open"
+
+
+def test_async_deadline_timeout_is_neutral():
+    breaker = _breaker()
+    timeout = httpx.Timeout(0.5, connect=0.5)
+    
+    async def hang(timeout):
+        raise _timeout_error()
+    
+    async def run():
+        for _ in range(4):
+            with pytest.raises(app.DeadlineExceededError):
+                await breaker.acall(functools.partial(app._acall_within_deadline, hang, timeout, 60.0))
+    
+    asyncio.run(run())
+    assert breaker.state == "closed"
+
+
+def test_cancelled_probe_is_released():
+    breaker = _breaker(open_seconds=0.0)
+    for _ in range(2):
+        with pytest.raises(APIStatusError):
+            breaker.call(functools.partial(_fail, _status_error(500)))
+    
+    async def probe():
+        await asyncio.sleep(10)
+    
+    async def run():
+        task = asyncio.ensure_future(breaker.acall(probe))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    
+    asyncio.run(run())
+    assert breaker.state == "half_open"
+    assert breaker.allow()
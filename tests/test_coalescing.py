@@ -0,0 +1,211 @@
+"""Coalesced streams: one upstream run fanned out to every caller, stopped once all of them leave"""
+import asyncio
+import threading
+
+import pytest
+
+import app
+
+CHUNKS = ["I", "I build", "I build things"]
+
+
+class Source:
+    """Counts upstream runs and records whether each one was closed before finishing"""
+
+    def __init__(self, chunks=CHUNKS, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.calls = 0
+        self.closed = 0
+        self.finished = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self._run()
+
+    def _run(self):
+        try:
+            yield from self.chunks
+            if self.error is not None:
+                raise self.error
+            self.finished += 1
+        except GeneratorExit:
+            self.closed += 1
+            raise
+
+
+def test_followers_receive_the_leaders_chunks():
+    flights, source = app.StreamSingleFlight(), Source()
+    leader, shared = flights.do("key", source)
+    assert not shared
+    followers = [flights.do("key", source) for _ in range(2)]
+    assert all(shared for _, shared in followers)
+
+    streams = [leader] + [values for values, _ in followers]
+    received = [[] for _ in streams]
+    # Take turns, so every caller drives some of the run
+    for _ in CHUNKS:
+        for stream, values in zip(streams, received):
+            values.append(next(stream))
+    for stream in streams:
+        with pytest.raises(StopIteration):
+            next(stream)
+
+    assert received == [CHUNKS] * 3
+    assert source.calls == 1 and source.finished == 1
+
+
+def test_concurrent_callers_share_one_run():
+    flights, source = app.StreamSingleFlight(), Source()
+    started = threading.Barrier(4)
+    results = {}
+
+    def ask(n):
+        values, _ = flights.do("key", source)
+        started.wait()
+        results[n] = list(values)
+
+    threads = [threading.Thread(target=ask, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert source.calls == 1
+    # Values are cumulative, so a caller may skip some, but always sees the complete reply last
+    for values in results.values():
+        assert values[-1] == CHUNKS[-1]
+        assert values == sorted(values, key=CHUNKS.index)
+
+
+def test_upstream_error_reaches_every_subscriber():
+    flights, source = app.StreamSingleFlight(), Source(error=ValueError("upstream failed"))
+    streams = [flights.do("key", source)[0] for _ in range(3)]
+    for stream in streams:
+        with pytest.raises(ValueError, match="upstream failed"):
+            list(stream)
+    assert source.calls == 1
+
+
+def test_source_closes_once_the_last_subscriber_leaves():
+    flights, source = app.StreamSingleFlight(), Source()
+    first, _ = flights.do("key", source)
+    second, _ = flights.do("key", source)
+    next(first)
+    next(second)
+
+    first.close()
+    assert source.closed == 0
+    assert next(second) == CHUNKS[1]
+    second.close()
+    assert source.closed == 1 and source.finished == 0
+
+    # The abandoned run is retired, so the next caller starts over
+    values, shared = flights.do("key", source)
+    assert not shared
+    assert list(values) == CHUNKS
+    assert source.calls == 2
+
+
+def test_request_after_completion_starts_a_fresh_call():
+    flights, source = app.StreamSingleFlight(), Source()
+    assert list(flights.do("key", source)[0]) == CHUNKS
+    values, shared = flights.do("key", source)
+    assert not shared
+    assert list(values) == CHUNKS
+    assert source.calls == 2 and source.finished == 2
+
+
+class AsyncSource:
+    """Async Source whose chunks only arrive when the test releases them"""
+
+    def __init__(self, chunks=CHUNKS, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.calls = 0
+        self.closed = 0
+        self.release = asyncio.Event()
+
+    def __call__(self):
+        self.calls += 1
+        return self._run()
+
+    async def _run(self):
+        try:
+            for chunk in self.chunks:
+                await self.release.wait()
+                yield chunk
+            if self.error is not None:
+                raise self.error
+        except (GeneratorExit, asyncio.CancelledError):
+            self.closed += 1
+            raise
+
+
+async def _collect(stream):
+    return [value async for value in stream]
+
+
+def test_async_followers_receive_the_leaders_chunks():
+    async def run():
+        flights, source = app.AsyncStreamSingleFlight(), AsyncSource()
+        streams = [flights.do("key", source) for _ in range(3)]
+        assert [shared for _, shared in streams] == [False, True, True]
+        source.release.set()
+        results = await asyncio.gather(*(_collect(stream) for stream, _ in streams))
+        assert source.calls == 1
+        for values in results:
+            assert values[-1] == CHUNKS[-1]
+        assert not flights._flights
+
+    asyncio.run(run())
+
+
+def test_async_upstream_error_reaches_every_subscriber():
+    async def run():
+        flights, source = app.AsyncStreamSingleFlight(), AsyncSource(error=ValueError("upstream failed"))
+        streams = [flights.do("key", source)[0] for _ in range(2)]
+        source.release.set()
+        results = await asyncio.gather(*(_collect(stream) for stream in streams), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert source.calls == 1
+
+    asyncio.run(run())
+
+
+def test_async_run_survives_a_cancelled_subscriber():
+    async def run():
+        flights, source = app.AsyncStreamSingleFlight(), AsyncSource()
+        cancelled = asyncio.ensure_future(_collect(flights.do("key", source)[0]))
+        survivor = asyncio.ensure_future(_collect(flights.do("key", source)[0]))
+        await asyncio.sleep(0.01)
+        # The cancelled caller may be the one waiting on the fetch; the other must still get it
+        cancelled.cancel()
+        source.release.set()
+        assert (await survivor)[-1] == CHUNKS[-1]
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert source.calls == 1 and source.closed == 0
+
+    asyncio.run(run())
+
+
+def test_async_source_closes_once_every_subscriber_is_cancelled():
+    async def run():
+        flights, source = app.AsyncStreamSingleFlight(), AsyncSource()
+        tasks = [asyncio.ensure_future(_collect(flights.do("key", source)[0])) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        assert source.closed == 1
+        assert not flights._flights
+
+        source.release.set()
+        values, shared = flights.do("key", source)
+        assert not shared
+        assert await _collect(values) == CHUNKS
+        assert source.calls == 2
+
+    asyncio.run(run())
@@ -0,0 +1,58 @@
+"""The PDF extraction cache is keyed by content and only ever prunes its own source's entries"""
+import io
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+import app
+import pdf_extraction
+
+OPTIONS = {"extraction_mode": "plain"}
+
+
+def _pdf_bytes(pages: int) -> bytes:
+    """A PDF whose page n reads "Page n", so extracted pages can be checked for order"""
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for n in range(pages):
+        page = writer.add_blank_page(width=200, height=200)
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 20 100 Td (Page {n}) Tj ET".encode("ascii"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def test_writing_an_entry_prunes_only_the_same_source(tmp_path):
+    stale = tmp_path / f"linkedin-{'a' * 64}.json"
+    other_source = tmp_path / f"linkedin-old-{'b' * 64}.json"
+    unrelated = tmp_path / "linkedin-notes.json"
+    for path in (stale, other_source, unrelated):
+        path.write_text("{}", encoding="utf-8")
+
+    current = tmp_path / f"linkedin-{'c' * 64}.json"
+    app._write_extraction_cache(str(current), "me/linkedin.pdf", "text", OPTIONS)
+
+    assert not stale.exists()
+    assert other_source.exists()
+    assert unrelated.exists()
+    assert app._read_extraction_cache(str(current)) == "text"
+
+
+def test_pages_are_extracted_from_the_hashed_bytes():
+    assert pdf_extraction.extract_pages(_pdf_bytes(3), OPTIONS) == ["Page 0", "Page 1", "Page 2"]
+
+
+def test_parallel_extraction_keeps_page_order(caplog):
+    # Five pages over two workers: uneven ranges, so a misplaced chunk would show
+    pages = pdf_extraction.extract_pages(_pdf_bytes(5), OPTIONS, workers=2, min_pages=2)
+    assert pages == [f"Page {n}" for n in range(5)]
+    assert "falling back to serial" not in caplog.text
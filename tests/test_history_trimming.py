@@ -0,0 +1,49 @@
+"""History trimming: the newest messages that fit the token budget, the oldest kept one truncated"""
+import app
+
+
+def _message(n, tokens):
+    # Exactly tokens estimated tokens of content, tagged so order can be checked
+    return {"role": "user" if n % 2 == 0 else "assistant", "content": f"{n:03d}".ljust(tokens * app.CHARS_PER_TOKEN, "x")}
+
+
+def _cost(messages):
+    return sum(app._estimate_tokens(msg["content"]) + app.MESSAGE_TOKEN_OVERHEAD for msg in messages)
+
+
+def test_everything_fits():
+    history = [_message(n, 10) for n in range(4)]
+    assert app._trim_history(history, 1000) == (history, 0)
+
+
+def test_oldest_messages_are_dropped_first():
+    history = [_message(n, 10) for n in range(4)]
+    kept, dropped = app._trim_history(history, 2 * (10 + app.MESSAGE_TOKEN_OVERHEAD))
+    assert kept == history[2:]
+    assert dropped == 2
+
+
+def test_oldest_kept_message_is_truncated_to_the_allowance():
+    history = [_message(0, 500), _message(1, 10)]
+    budget = (10 + app.MESSAGE_TOKEN_OVERHEAD) + app.MESSAGE_TOKEN_OVERHEAD + 100
+    kept, dropped = app._trim_history(history, budget)
+    assert dropped == 0
+    assert kept[1] == history[1]
+    assert kept[0]["role"] == history[0]["role"]
+    assert kept[0]["content"].startswith("000") and kept[0]["content"].endswith(" …")
+    assert app._estimate_tokens(kept[0]["content"]) == 100
+    assert _cost(kept) == budget
+
+
+def test_allowance_below_the_minimum_drops_the_message():
+    history = [_message(0, 500), _message(1, 10)]
+    allowance = app.MIN_TRUNCATED_TOKENS - 1
+    budget = (10 + app.MESSAGE_TOKEN_OVERHEAD) + app.MESSAGE_TOKEN_OVERHEAD + allowance
+    assert app._trim_history(history, budget) == ([history[1]], 1)
+
+
+def test_nothing_is_kept_when_the_budget_is_already_spent():
+    # The system prompt and new message alone can overrun the budget, leaving less than zero
+    history = [_message(n, 10) for n in range(3)]
+    assert app._trim_history(history, 0) == ([], 3)
+    assert app._trim_history(history, -500) == ([], 3)
@@ -0,0 +1,95 @@
+"""Profile hot reload: settled file changes only, no swap to a half-written profile, pinned snapshots"""
+import os
+
+import pytest
+
+import app
+
+SUMMARY = "I build backend services in Python."
+
+
+def _touch(path, text, mtime):
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def summary_path(tmp_path):
+    path = tmp_path / "summary.txt"
+    _touch(path, SUMMARY, 1_000_000_000)
+    return path
+
+
+@pytest.fixture
+def chatbot(summary_path, stub_settings):
+    return app.PersonalChatbot(settings=stub_settings(summary_path=str(summary_path)))
+
+
+def test_watcher_reloads_once_a_change_has_settled(summary_path):
+    reloads = []
+    watcher = app.ProfileWatcher([str(summary_path)], lambda: reloads.append(1), interval=60.0)
+    assert not watcher.poll()
+
+    _touch(summary_path, SUMMARY + " And Go.", 2_000_000_000)
+    assert not watcher.poll()
+    assert watcher.poll()
+    assert not watcher.poll()
+    assert reloads == [1]
+
+
+def test_watcher_waits_while_the_file_is_still_being_written(summary_path):
+    reloads = []
+    watcher = app.ProfileWatcher([str(summary_path)], lambda: reloads.append(1), interval=60.0)
+
+    _touch(summary_path, "I build", 2_000_000_000)
+    assert not watcher.poll()
+    _touch(summary_path, "I build backend services in Python and Go.", 3_000_000_000)
+    assert not watcher.poll()
+    assert watcher.poll()
+    assert reloads == [1]
+
+
+def test_watcher_ignores_a_change_that_is_reverted_before_it_settles(summary_path):
+    reloads = []
+    watcher = app.ProfileWatcher([str(summary_path)], lambda: reloads.append(1), interval=60.0)
+
+    _touch(summary_path, "", 2_000_000_000)
+    assert not watcher.poll()
+    _touch(summary_path, SUMMARY, 1_000_000_000)
+    assert not watcher.poll()
+    assert not watcher.poll()
+    assert reloads == []
+
+
+def test_reload_swaps_in_changed_content(chatbot, summary_path):
+    before = chatbot.profile
+    assert not chatbot.reload_profile()
+    summary_path.write_text(SUMMARY + " I also lead a platform team.", encoding="utf-8")
+    assert chatbot.reload_profile()
+    assert chatbot.profile.version != before.version
+    assert "platform team" in chatbot.profile.block
+
+
+@pytest.mark.parametrize("change", ["missing", "empty"])
+def test_reload_keeps_the_current_profile_when_a_source_disappears(chatbot, summary_path, change):
+    before = chatbot.profile
+    if change == "missing":
+        summary_path.unlink()
+    else:
+        summary_path.write_text("", encoding="utf-8")
+    assert not chatbot.reload_profile()
+    assert chatbot.profile is before
+
+
+def test_request_keeps_the_snapshot_it_started_with(chatbot, summary_path):
+    before = chatbot.profile
+    token = app._current_trace.set(app.RequestTrace("test"))
+    try:
+        assert chatbot.profile is before
+        summary_path.write_text(SUMMARY + " I also lead a platform team.", encoding="utf-8")
+        assert chatbot.reload_profile()
+        assert chatbot.profile is before
+    finally:
+        app._current_trace.reset(token)
+    assert chatbot.profile is not before
+    assert "platform team" in chatbot.profile.block
@@ -0,0 +1,89 @@
+"""The leading system message must be byte-identical across prompt variants, so upstream
+prefix caches keep hitting; everything that varies per request goes after it."""
+
+import pytest
+
+import app
+
+QUESTION = "What are you working on at the moment?"
+PATENT_QUESTION = "Do you hold any patents?"
+# The patent rule's wording, not just "pig latin", which a profile may legitimately mention
+PATENT_RULE = "respond only and entirely in pig latin"
+
+
+@pytest.fixture(params=["full", "retrieval"])
+def chatbot(request, tmp_path, stub_settings):
+    summary_path = tmp_path / "summary.txt"
+    summary_path.write_text(
+        "I build backend services in Python and once gave a talk on pig latin parsers.\n\n"
+        + "I have shipped search, ranking and data pipelines at several companies.\n\n" * 40,
+        encoding="utf-8",
+    )
+    settings = stub_settings(
+        summary_path=str(summary_path),
+        # A profile above the threshold moves into per-request excerpts
+        retrieval_min_profile_chars=0 if request.param == "retrieval" else 10**9,
+    )
+    return app.PersonalChatbot(settings=settings)
+
+
+def _static_prefix(chatbot):
+    """Number of leading system messages that must never vary: the instructions, then the profile block"""
+    return 1 if chatbot.profile.index is not None else 2
+
+
+def test_chat_variants_share_the_system_prefix(chatbot):
+    size = _static_prefix(chatbot)
+    prefix = chatbot._build_messages(QUESTION, [])[:size]
+    variants = [
+        chatbot._build_messages(QUESTION, [], chatbot._request_instructions(QUESTION)),
+        chatbot._build_messages(PATENT_QUESTION, [], chatbot._request_instructions(PATENT_QUESTION)),
+        chatbot._build_messages(
+            QUESTION, [], chatbot._regeneration_instructions("Draft answer.", QUESTION, "Too vague.")
+        ),
+    ]
+    for messages in variants:
+        assert messages[:size] == prefix
+    assert all(PATENT_RULE not in msg["content"] for msg in prefix)
+    assert PATENT_RULE in variants[1][-1]["content"]
+
+
+def test_evaluator_variants_share_the_system_prefix(chatbot):
+    size = _static_prefix(chatbot)
+    plain = chatbot._build_evaluation_messages("Draft answer.", QUESTION, [])
+    patent = chatbot._build_evaluation_messages("Ikay orkway...", PATENT_QUESTION, [])
+    assert plain[:size] == patent[:size]
+
+
+def test_chat_and_evaluator_share_one_profile_block(chatbot):
+    profile = chatbot.profile
+    assert "data pipelines" not in profile.system_prompt
+    assert "data pipelines" not in profile.evaluator_prompt
+    if profile.index is not None:
+        assert profile.block == ""
+        return
+    chat = chatbot._build_messages(QUESTION, [])
+    evaluation = chatbot._build_evaluation_messages("Draft answer.", QUESTION, [])
+    assert "data pipelines" in profile.block
+    assert chat[1]["content"] is profile.block
+    assert evaluation[1]["content"] is profile.block
+
+
+def test_retrieved_excerpts_stay_out_of_the_system_prompt(chatbot):
+    if chatbot.profile.index is None:
+        pytest.skip("profile is sent in full")
+    prefix = chatbot._build_messages(QUESTION, [])[0]["content"]
+    instructions = chatbot._request_instructions(QUESTION)
+    assert "data pipelines" in instructions
+    assert "data pipelines" not in prefix
+
+
+def test_a_new_profile_version_changes_the_cache_scopes(chatbot, tmp_path):
+    before = chatbot.profile
+    scope = chatbot._near_duplicate_scope(QUESTION)
+    summary_path = tmp_path / "summary.txt"
+    summary_path.write_text(summary_path.read_text(encoding="utf-8") + "\nNow I lead a platform team.", encoding="utf-8")
+    assert chatbot.reload_profile()
+    assert chatbot.profile.version != before.version
+    assert chatbot.profile.prompt_fingerprint != before.prompt_fingerprint
+    assert chatbot._near_duplicate_scope(QUESTION) != scope
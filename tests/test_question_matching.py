@@ -0,0 +1,146 @@
+"""Reworded-question matching must not hand out an answer to a different question"""
+
+import pytest
+
+import app
+
+
+def _bank():
+    return app.AnswerBank([
+        {"question": "When did you start programming?", "answer": "In 2015."},
+        {"question": "Where did you study?", "answer": "At MIT."},
+        {"question": "Are you open to relocating?", "answer": "Yes."},
+    ])
+
+
+def test_answer_bank_matches_rewordings():
+    bank = _bank()
+    assert bank.match("when did you start programming")["answer"] == "In 2015."
+    assert bank.match("When did you first start programming?")["answer"] == "In 2015."
+    assert bank.match("Are you open to relocating?")["answer"] == "Yes."
+
+
+def test_answer_bank_treats_what_which_and_tell_me_about_alike():
+    bank = app.AnswerBank([
+        {"question": "What programming languages do you know?", "answer": "Python and Go."},
+        {"question": "What is your experience with Python?", "answer": "Ten years."},
+    ])
+    assert bank.match("Which programming languages do you know?")["answer"] == "Python and Go."
+    assert bank.match("Tell me about your Python experience")["answer"] == "Ten years."
+    assert bank.match("Tell me about your Java experience") is None
+
+
+def test_answer_bank_requires_the_same_question_word():
+    bank = _bank()
+    assert bank.match("Why did you start programming?") is None
+    assert bank.match("How did you start programming?") is None
+    assert bank.match("When did you study?") is None
+
+
+def test_answer_bank_requires_the_same_polarity():
+    bank = _bank()
+    assert bank.match("Aren't you open to relocating?") is None
+    assert bank.match("Are you not open to relocating?") is None
+
+
+# Labelled pairs the default near-duplicate threshold and bank similarity are set against: every
+# paraphrase scores at least 0.78 and every different question at most 0.6
+PARAPHRASES = [
+    ("What languages have you worked with?", "Which programming languages do you use?"),
+    ("What programming languages do you know?", "Which programming languages do you know?"),
+    ("Tell me about your Python experience", "What's your experience with Python?"),
+    ("Are you open to work?", "Are you currently open to work?"),
+    ("What technologies do you work with?", "Which technologies do you use?"),
+    ("What projects have you worked on?", "Tell me about projects you have worked on"),
+    ("What is your current role?", "What's your current job?"),
+    ("What's your educational background?", "What is your education background?"),
+    ("Can you tell me about your machine learning projects?", "What machine learning projects have you done?"),
+    ("What certifications do you have?", "Which certifications do you hold?"),
+]
+DIFFERENT_QUESTIONS = [
+    ("What is your experience with Python?", "What is your experience with Java?"),
+    ("Do you have experience with AWS?", "Do you have experience with Azure?"),
+    ("What languages do you speak?", "What programming languages do you know?"),
+    ("How long have you used Python?", "How long have you used Go?"),
+    ("What companies have you worked for?", "What companies would you like to work for?"),
+    ("Are you available for freelance work?", "Are you available for full-time work?"),
+    ("What was your first job?", "What is your current job?"),
+    ("Did you study at university?", "Where did you study at university?"),
+    ("When did you start programming?", "How did you start programming?"),
+    ("Are you open to relocating?", "Aren't you open to relocating?"),
+    ("Who have you worked with?", "Who do you know?"),
+    ("What tools do you use at work?", "What tools do you know?"),
+    ("What do you use for testing?", "What do you know about testing?"),
+]
+
+
+def _cache(threshold=0.7):
+    return app.NearDuplicateCache(max_entries=16, ttl_seconds=3600, threshold=threshold)
+
+
+def _default_cache():
+    return _cache(app.Settings.model_fields["near_duplicate_threshold"].default)
+
+
+def test_near_duplicate_cache_matches_rewordings():
+    cache = _cache()
+    cache.put("scope", "What is your experience with Python?", "Ten years.")
+    assert cache.get("scope", "what's your python experience")[2] == "Ten years."
+    assert cache.get("other-scope", "what's your python experience") is None
+
+
+@pytest.mark.parametrize("cached, asked", PARAPHRASES)
+def test_default_threshold_matches_paraphrases(cached, asked):
+    cache = _default_cache()
+    cache.put("scope", cached, "reply")
+    assert cache.get("scope", asked) is not None
+
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT_QUESTIONS)
+def test_default_threshold_rejects_different_questions(cached, asked):
+    cache = _default_cache()
+    cache.put("scope", cached, "reply")
+    assert cache.get("scope", asked) is None
+
+
+@pytest.mark.parametrize("question, asked", PARAPHRASES)
+def test_answer_bank_matches_paraphrases(question, asked):
+    bank = app.AnswerBank([{"question": question, "answer": "reply"}])
+    assert bank.match(asked) is not None
+
+
+@pytest.mark.parametrize("question, asked", DIFFERENT_QUESTIONS)
+def test_answer_bank_rejects_different_questions(question, asked):
+    bank = app.AnswerBank([{"question": question, "answer": "reply"}])
+    assert bank.match(asked) is None
+
+
+def test_work_with_means_use_only_for_technologies():
+    assert app._match_tokens("What frameworks have you worked with?") == app._match_tokens("What frameworks do you use?")
+    assert app._match_tokens("Have you worked with any databases?") == app._match_tokens("Have you used any databases?")
+    assert "use" not in app._match_tokens("Who have you worked with?")
+
+
+def test_near_duplicate_cache_requires_the_same_question_word():
+    cache = _cache()
+    cache.put("scope", "Did you study at university?", "Yes.")
+    assert cache.get("scope", "Where did you study at university?") is None
+
+
+def test_near_duplicate_cache_requires_the_same_polarity():
+    cache = _cache()
+    cache.put("scope", "Are you open to relocating to Germany?", "Yes.")
+    assert cache.get("scope", "Are you not open to relocating to Germany?") is None
+
+
+def test_contractions_keep_question_words_and_negations():
+    assert app._match_tokens("Whats your experience?") == app._match_tokens("What's your experience?")
+    assert app._question_form("Dont you use Java?") == (frozenset({"yes/no"}), True)
+
+
+def test_question_forms_conflict_only_when_both_have_question_words():
+    what = app._question_form("What's your Python experience?")
+    assert app._same_question_form(what, app._question_form("Which Python projects?"))
+    assert app._same_question_form(what, app._question_form("Python experience?"))
+    assert not app._same_question_form(what, app._question_form("Why Python?"))
+    assert not app._same_question_form(what, app._question_form("Did you use Python?"))
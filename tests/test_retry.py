@@ -0,0 +1,128 @@
+"""Retries of transient upstream failures: jittered backoff, Retry-After and the request deadline"""
+import asyncio
+import email.utils
+import random
+import time
+
+import httpx
+import pytest
+from openai import APIConnectionError, APIStatusError
+
+import app
+
+
+def _status_error(status: int, headers=None):
+    request = httpx.Request("POST", "http://upstream.test/v1/chat/completions")
+    return APIStatusError(
+        "upstream error", response=httpx.Response(status, headers=headers or {}, request=request), body=None
+    )
+
+
+def _connection_error():
+    return APIConnectionError(request=httpx.Request("POST", "http://upstream.test/v1/chat/completions"))
+
+
+def _policy(**overrides):
+    options = dict(max_retries=3, base_delay=0.001, max_delay=0.004, deadline_seconds=60.0)
+    options.update(overrides)
+    return app.RetryPolicy("generation", **options)
+
+
+class Flaky:
+    """Fails with each of errors in turn, then succeeds"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_backoff_stays_within_the_full_jitter_bounds():
+    policy = _policy(max_retries=10, base_delay=0.5, max_delay=8.0, rng=random.Random(7))
+    deadline = time.perf_counter() + 3600
+    for attempt in range(1, 11):
+        cap = min(8.0, 0.5 * 2 ** (attempt - 1))
+        delays = [policy._next_delay(attempt, _status_error(503), deadline) for _ in range(200)]
+        assert all(0.0 <= delay <= cap for delay in delays)
+        # Jittered across the whole range, not pinned to the cap
+        assert max(delays) - min(delays) > cap / 2
+
+
+def test_retry_after_seconds():
+    assert app._retry_after(_status_error(429, {"retry-after": "2"})) == 2.0
+
+
+def test_retry_after_ms_takes_precedence():
+    error = _status_error(429, {"retry-after-ms": "1500", "retry-after": "30"})
+    assert app._retry_after(error) == 1.5
+
+
+def test_retry_after_http_date():
+    when = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 28.0 <= app._retry_after(_status_error(503, {"retry-after": when})) <= 30.0
+
+
+def test_unparseable_or_missing_retry_after_falls_back_to_backoff():
+    assert app._retry_after(_status_error(503, {"retry-after": "soon"})) is None
+    assert app._retry_after(_status_error(503)) is None
+    assert app._retry_after(_connection_error()) is None
+
+
+def test_retry_after_replaces_the_computed_backoff():
+    policy = _policy(max_delay=0.001)
+    delay = policy._next_delay(1, _status_error(429, {"retry-after": "2"}), time.perf_counter() + 60)
+    assert delay == 2.0
+
+
+def test_transient_failures_are_retried():
+    fn = Flaky(_status_error(503), _status_error(429), _connection_error())
+    assert _policy().call(fn) == "ok"
+    assert fn.calls == 4
+
+
+def test_retries_stop_after_max_retries():
+    fn = Flaky(*[_status_error(502)] * 3)
+    with pytest.raises(APIStatusError):
+        _policy(max_retries=2).call(fn)
+    assert fn.calls == 3
+
+
+@pytest.mark.parametrize("error", [
+    _status_error(400), _status_error(401), _status_error(404), _status_error(422),
+    app.CircuitOpenError("generation circuit is open"),
+])
+def test_client_errors_and_open_circuits_are_not_retried(error):
+    fn = Flaky(error)
+    with pytest.raises(type(error)):
+        _policy().call(fn)
+    assert fn.calls == 1
+
+
+def test_no_retry_when_the_backoff_would_pass_the_deadline():
+    fn = Flaky(_status_error(503, {"retry-after": "5"}))
+    started = time.perf_counter()
+    with pytest.raises(APIStatusError):
+        _policy(deadline_seconds=1.0).call(fn)
+    assert fn.calls == 1
+    # Gave up straight away instead of sleeping into the deadline
+    assert time.perf_counter() - started < 1.0
+
+
+def test_async_retries_share_the_policy():
+    async def run():
+        fn = Flaky(_status_error(503), _status_error(400))
+
+        async def attempt():
+            return fn()
+
+        with pytest.raises(APIStatusError) as excinfo:
+            await _policy().acall(attempt)
+        assert excinfo.value.status_code == 400
+        assert fn.calls == 2
+
+    asyncio.run(run())
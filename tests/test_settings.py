@@ -0,0 +1,81 @@
+"""Settings precedence: defaults < CHATBOT_CONFIG file < environment, per field and per stage field"""
+import json
+
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch):
+    for name in ["CHATBOT_CONFIG", *app._LEGACY_ENV_ALIASES.values()]:
+        monkeypatch.delenv(name, raising=False)
+    for prefix in app._STAGE_ENV_PREFIXES.values():
+        for field in app.StageSettings.model_fields:
+            monkeypatch.delenv(f"{prefix}{field.upper()}", raising=False)
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    def write(data):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps(data), encoding="utf-8")
+        monkeypatch.setenv("CHATBOT_CONFIG", str(path))
+
+    return write
+
+
+def test_environment_overrides_the_config_file(config_file, monkeypatch):
+    config_file({
+        "response_cache_ttl": 60,
+        "response_cache_size": 32,
+        "generation": {"model": "file-model", "temperature": 0.2},
+    })
+    monkeypatch.setenv("RESPONSE_CACHE_TTL", "120")
+    monkeypatch.setenv("GENERATOR_MODEL", "env-model")
+
+    settings = app.Settings.load()
+    assert settings.response_cache_ttl == 120.0
+    assert settings.response_cache_size == 32
+    assert settings.generation.model == "env-model"
+    assert settings.generation.temperature == 0.2
+    # Stage fields set nowhere keep the stage's own defaults
+    assert settings.generation.max_tokens == 1000
+    assert settings.evaluation.read_timeout == 30.0
+
+
+def test_hedge_stage_exists_only_when_configured():
+    assert app.Settings.load().hedge_generation is None
+
+
+def test_hedge_stage_inherits_from_generation(config_file, monkeypatch):
+    config_file({"generation": {"temperature": 0.2}})
+    monkeypatch.setenv("GENERATOR_MODEL", "primary-model")
+    monkeypatch.setenv("HEDGE_BASE_URL", "https://hedge.test/v1")
+
+    settings = app.Settings.load()
+    hedge = settings.hedge_generation
+    assert hedge.base_url == "https://hedge.test/v1"
+    assert hedge.model == "primary-model"
+    assert hedge.temperature == 0.2
+    assert hedge.max_tokens == settings.generation.max_tokens
+
+
+def test_legacy_base_url_variables_still_apply(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_BASE_URL", "http://localhost:8900/v1")
+    monkeypatch.setenv("GEMINI_BASE_URL", "http://localhost:8901/v1")
+    settings = app.Settings.load()
+    assert settings.generation.base_url == "http://localhost:8900/v1"
+    assert settings.evaluation.base_url == "http://localhost:8901/v1"
+
+
+def test_new_stage_variables_win_over_legacy_aliases(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_BASE_URL", "http://localhost:8900/v1")
+    monkeypatch.setenv("GENERATOR_BASE_URL", "http://localhost:9000/v1")
+    assert app.Settings.load().generation.base_url == "http://localhost:9000/v1"
+
+
+def test_invalid_values_are_rejected(monkeypatch):
+    monkeypatch.setenv("GENERATOR_BASE_URL", "localhost:8900")
+    with pytest.raises(ValueError, match="base_url"):
+        app.Settings.load()